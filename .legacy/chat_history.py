@@ -1,6 +1,19 @@
 import json
 import os
 
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    _loads = json.loads
+
 CHAT_DIR = "chat_data"
 current_chat_file = os.path.join(CHAT_DIR, "chat_1.json")  # по умолчанию
 
@@ -8,21 +21,47 @@ def set_current_chat(path):
     global current_chat_file
     current_chat_file = path
 
+def _migrate_to_jsonl(path):
+    """Один раз переводим старый JSON-массив в формат JSON Lines."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw.lstrip().startswith(b"["):
+        history = json.loads(raw)
+        _write_jsonl(path, history)
+
+def _write_jsonl(path, history):
+    with open(path, "wb") as f:
+        for message in history:
+            f.write(_dumps(message) + b"\n")
+
+def load_history_jsonl(path):
+    history = []
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                history.append(_loads(line))
+    return history
+
 def load_history():
     if not os.path.exists(current_chat_file):
         save_history([])
-    with open(current_chat_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+    _migrate_to_jsonl(current_chat_file)
+    return load_history_jsonl(current_chat_file)
 
 def save_history(history):
-    with open(current_chat_file, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+    """Полная перезапись — нужна только при создании/миграции."""
+    _write_jsonl(current_chat_file, history)
+
+def append_message_to_disk(path, role, content, image=None):
+    message = {"role": role, "content": content}
+    if image:
+        message["image"] = image
+    with open(path, "ab") as f:
+        f.write(_dumps(message) + b"\n")
 
 def append_message(history, role, content, image=None):
     message = {"role": role, "content": content}
     if image:
         message["image"] = image  # ⬅️ сохраняем путь к изображению
     history.append(message)
-    save_history(history)
-
-
+    append_message_to_disk(current_chat_file, role, content, image=image)
@@ -23,8 +23,10 @@ Usage in ui_layout.py:
 Each plugin implements BaseImagePlugin defined below.
 """
 
+import ast
 import importlib
-import pkgutil
+import importlib.util
+import os
 from pathlib import Path
 from typing import Protocol, runtime_checkable, Dict, List
 
@@ -46,28 +48,88 @@ class BaseImagePlugin(Protocol):
     @ staticmethod
     def configure(parent, image_path: str) -> dict | None: ...
 
+# (mtime каталога plugins/, список модулей) — пересканируем только при изменении каталога
+_MOD_CACHE: tuple[float, List[str]] | None = None
+
+
 def _iter_module_names() -> List[str]:
+    global _MOD_CACHE
     package = importlib.import_module(PLUGIN_PACKAGE)
-    return [
-        f"{PLUGIN_PACKAGE}.{name}"
-        for _, name, _ in pkgutil.iter_modules(package.__path__)
-    ]
+    directory = package.__path__[0]
+    mtime = os.stat(directory).st_mtime
+    if _MOD_CACHE is not None and _MOD_CACHE[0] == mtime:
+        return _MOD_CACHE[1]
+    with os.scandir(directory) as it:
+        names = [
+            f"{PLUGIN_PACKAGE}.{entry.name[:-3]}"
+            for entry in it
+            if entry.is_file() and entry.name.endswith(".py") and not entry.name.startswith("_")
+        ]
+    _MOD_CACHE = (mtime, names)
+    return names
+
+
+def _read_display_name(path: Path) -> str | None:
+    """Extract ``display_name`` from plugin source without executing it."""
+    source = path.read_text(encoding="utf-8")
+    for line in source.splitlines():
+        if line.startswith("# display_name:"):
+            return line.split(":", 1)[1].strip()
+    try:
+        tree = ast.parse(source, filename=str(path))
+    except SyntaxError:
+        return None
+
+    def _constant(body) -> str | None:
+        for node in body:
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant):
+                if any(isinstance(t, ast.Name) and t.id == "display_name" for t in node.targets):
+                    return str(node.value.value)
+        return None
+
+    # module-level constant first, then `class Plugin: display_name = ...`
+    name = _constant(tree.body)
+    if name is None:
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name == "Plugin":
+                name = _constant(node.body)
+    return name
+
+
+class LazyPlugin:
+    """Proxy that imports the plugin module only on first real use."""
+
+    def __init__(self, module_name: str, display_name: str):
+        self._name = module_name
+        self.display_name = display_name
+        self._mod = None
+
+    def _load(self):
+        module = importlib.import_module(self._name)
+        # Possible forms: whole module is plugin; module exposes Plugin class; simple funcs
+        self._mod = module.Plugin() if hasattr(module, "Plugin") else module
+        return self._mod
+
+    def __getattr__(self, item):
+        # called only for attributes missing on the proxy (process/configure/…)
+        target = self._mod if self._mod is not None else self._load()
+        value = getattr(target, item)
+        if item in ("process", "configure"):
+            setattr(self, item, value)
+        return value
 
 
 def load_plugins() -> Dict[str, BaseImagePlugin]:
-    """Import all modules in *plugins/* and return mapping {display_name: plugin}."""
+    """Scan *plugins/* and return mapping {display_name: LazyPlugin} without importing."""
     plugins: Dict[str, BaseImagePlugin] = {}
     for mod_name in _iter_module_names():
-        module = importlib.import_module(mod_name)
-        # Possible forms: whole module is plugin; module exposes Plugin class; simple funcs
-        if isinstance(module, BaseImagePlugin):
-            plugins[module.display_name] = module  # type: ignore[arg-type]
-        elif hasattr(module, "Plugin"):
-            plugin_cls = getattr(module, "Plugin")
-            plugin = plugin_cls()
-            plugins[plugin.display_name] = plugin
-        elif hasattr(module, "process") and hasattr(module, "display_name"):
-            plugins[module.display_name] = module  # type: ignore[arg-type]
+        spec = importlib.util.find_spec(mod_name)  # locates the file, does not execute it
+        if spec is None or not spec.origin or not spec.origin.endswith(".py"):
+            continue
+        display_name = _read_display_name(Path(spec.origin))
+        if display_name is None:
+            continue
+        plugins[display_name] = LazyPlugin(mod_name, display_name)  # type: ignore[assignment]
     return plugins
 
 
@@ -12,15 +12,19 @@ from PyQt5.QtWidgets import (
     QFileDialog,
     QListWidget,
     QListWidgetItem,
+    QListView,
     QDialog,
-    QMessageBox, QScrollArea, QToolButton, QSplitter, QSizePolicy
+    QMessageBox, QMenu, QScrollArea, QSplitter, QSizePolicy
 )
 from PyQt5.QtWidgets import QComboBox
-from ai_design_assistant.core.models import get_current_model, set_current_model, list_models
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize, QTimer, QEvent
+from ai_design_assistant.core.models import (
+    get_current_model, set_current_model, list_models, invalidate_models_cache,
+)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize, QTimer
 from PyQt5.QtGui import QFont, QPixmap, QIcon
 import os
 import shutil
+from collections import OrderedDict
 from pathlib import Path
 
 from ai_design_assistant.core.logger import get_logger
@@ -30,6 +34,7 @@ from ai_design_assistant.core.chat import ChatSession
 from ai_design_assistant.core.chat import load_chats, create_new_chat
 from ai_design_assistant.core.plugins import get_plugins
 
+from chat_history import set_current_chat, load_history, append_message
 from settings_dialog import SettingsDialog   # <— новый импорт
 from ai_design_assistant.core.settings import AppSettings             # <— нужен для apply_theme
 
@@ -42,14 +47,19 @@ log = get_logger("ui")
 USER_AVA = "icons/user.png"
 AI_AVA   = "icons/ai.png"
 
+# путь → уже уменьшенный до 36×36 аватар (декодируем каждую иконку один раз)
+_AVATAR_CACHE: dict[str, QPixmap] = {}
+
 
 def list_chat_images(chat_json_name: str) -> list[str]:
     """Вернуть список путей к изображениям, хранящимся в папке текущего чата."""
     folder = Path("../chat_data") / chat_json_name.replace(".json", "")
-    exts = ("*.png", "*.jpg", "*.jpeg", "*.bmp")
-    paths: list[str] = []
-    for p in exts:
-        paths.extend(map(str, folder.glob(p)))
+    exts = {".png", ".jpg", ".jpeg", ".bmp"}
+    try:
+        with os.scandir(folder) as it:
+            paths = [e.path for e in it if e.is_file() and Path(e.name).suffix.lower() in exts]
+    except FileNotFoundError:
+        return []
     paths.sort()
     return paths
 
@@ -89,68 +99,62 @@ class MessageBubble(QWidget):
         main.setContentsMargins(6, 6, 6, 6)
 
         user_side = (role == "user")
+        self.role = role
+        self.ava_lbl: QLabel | None = None
 
         # 2) Создаём QLabel для текста сразу, до компоновки
         self.txt = QLabel(text)
         self.txt.setWordWrap(True)
         self.txt.setMaximumWidth(480)
         self.txt.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
-        self.txt.setProperty("bubbleRole", role)
+        self.txt.setObjectName(f"{role}_bubble")  # QSS: QLabel#user_bubble / #assistant_bubble
+
+        # копирование — через контекстное меню, без отдельной панели с кнопкой
+        self.txt.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.txt.customContextMenuRequested.connect(self._show_context_menu)
+
+        if not avatar:
+            # без аватара вложенный QHBoxLayout + спейсер не нужны
+            main.addWidget(self.txt, 0, Qt.AlignRight if user_side else Qt.AlignLeft)
+            return
 
         # 3) Верхняя строка: аватар + пузырь + спейсер
         top = QHBoxLayout()
         top.setSpacing(6)
 
-        # аватар (если есть)
-        if avatar:
-            ava_lbl = QLabel()
-            ava_lbl.setPixmap(avatar.scaled(36, 36, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        ava_lbl = self.ava_lbl = QLabel()
+        ava_lbl.setPixmap(avatar)  # уже 36×36 из _AVATAR_CACHE
 
         # «губка» для прижатия
         spacer = QWidget()
         spacer.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
 
         if user_side:
-            # пользователь: [spacer][txt][avatar?]
+            # пользователь: [spacer][txt][avatar]
             top.addWidget(spacer)
             top.addWidget(self.txt)
-            if avatar:
-                top.addWidget(ava_lbl)
+            top.addWidget(ava_lbl)
         else:
-            # ассистент: [avatar?][txt][spacer]
-            if avatar:
-                top.addWidget(ava_lbl)
+            # ассистент: [avatar][txt][spacer]
+            top.addWidget(ava_lbl)
             top.addWidget(self.txt)
             top.addWidget(spacer)
 
         main.addLayout(top)
 
-        # 4) Нижняя строка: зарезервированная зона под кнопку копирования
-        self.copy_bar = QWidget()
-        self.copy_bar.setFixedHeight(24)
-        copy_layout = QHBoxLayout(self.copy_bar)
-        copy_layout.setContentsMargins(0, 0, 0, 0)
-        copy_layout.addStretch()
-        copy_btn = QToolButton()
-        copy_btn.setText("📋")
-        copy_btn.clicked.connect(self.copy_text)
-        copy_layout.addWidget(copy_btn)
-        self.copy_bar.hide()
-        main.addWidget(self.copy_bar)
-
-        # 5) Включаем Hover-события
-        self.setAttribute(Qt.WA_Hover)
+    def reset(self, text: str, role: str, avatar: QPixmap | None = None):
+        """Переиспользовать пузырь из пула: меняем только содержимое."""
+        self.txt.setText(text)
+        if avatar and self.ava_lbl is not None:
+            self.ava_lbl.setPixmap(avatar)
 
     def copy_text(self):
         QApplication.clipboard().setText(self.txt.text())
 
-    # Пока эта функция не нужна, пусть пока всегда скрыта кнопка
-    def event(self, e):
-        if e.type() == QEvent.HoverEnter:
-            self.copy_bar.hide()
-        elif e.type() == QEvent.HoverLeave:
-            self.copy_bar.hide()
-        return super().event(e)
+    def _show_context_menu(self, pos):
+        menu = QMenu(self.txt)
+        menu.addAction("📋 Копировать", self.copy_text)
+        menu.exec_(self.txt.mapToGlobal(pos))
 
 
 
@@ -162,6 +166,8 @@ class MessageBubble(QWidget):
 
 class ChatWindow(QMainWindow):
     THUMB_SIZE = QSize(80, 80)
+    THUMB_CACHE_MAX = 256
+    _QSS_CACHE: dict[str, str] = {}  # имя темы → текст QSS
 
     def __init__(self):
         super().__init__()
@@ -173,8 +179,22 @@ class ChatWindow(QMainWindow):
         self.current_theme = self.settings.get("theme", "dark").lower()
 
         self.image_path: str | None = None  # last uploaded image (for sending)
+        # отсоединённые пузыри для повторного использования (по роли)
+        self._bubble_pool: dict[str, list[MessageBubble]] = {"user": [], "assistant": []}
         self.reply_buffer: str = ""
         self.selected_gallery_image: str | None = None
+        # (path, mtime) → готовая иконка; LRU, чтобы не декодировать картинки заново
+        self._thumb_cache: OrderedDict[tuple[str, float], QIcon] = OrderedDict()
+
+        # токены копятся в reply_buffer и выводятся не чаще раза в кадр (~60 fps)
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(16)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.timeout.connect(self._flush_tokens)
+
+        # отложенные перерисовки галереи/списка чатов: не чаще раза за тик event loop
+        self._refresh_pending = False
+        self._pending_refresh: set[str] = set()
 
         self.setWindowTitle("ИИ‑ассистент дизайна")
         self.setMinimumSize(1100, 700)
@@ -209,7 +229,7 @@ class ChatWindow(QMainWindow):
         self.chat_list_widget.itemClicked.connect(self.handle_chat_selection)
         vbox.addWidget(QLabel("💬 Диалоги"))
         vbox.addWidget(self.chat_list_widget)
-        self.refresh_chat_list()
+        self._schedule_refresh("list")
 
         settings_btn = QPushButton("⚙️ Настройки…")
         settings_btn.clicked.connect(self.open_settings)
@@ -248,9 +268,12 @@ class ChatWindow(QMainWindow):
 
         self.scroll.setWidget(self.chat_container)
 
-        # восстановим историю
+        # восстановим историю одним проходом layout'а
+        self.chat_container.setUpdatesEnabled(False)
         for msg in self.chat_history:
-            self._add_bubble(msg["role"], msg["content"], avatar_path=None)
+            self._add_bubble(msg["role"], msg["content"], avatar_path=None, defer_scroll=True)
+        self.chat_container.setUpdatesEnabled(True)
+        QTimer.singleShot(0, self._scroll_to_bottom)
 
         self.spinner_label = QLabel("💬 ИИ набирает ответ…")
         self.spinner_label.setStyleSheet("color: gray;")
@@ -299,8 +322,14 @@ class ChatWindow(QMainWindow):
 
         vbox.addWidget(QLabel("🖼️ Галерея"))
         self.gallery = QListWidget(); self.gallery.setIconSize(self.THUMB_SIZE); self.gallery.itemClicked.connect(self.select_gallery_item)
+        # все миниатюры одного размера → быстрый путь раскладки, без пересчёта геометрии на каждый item
+        self.gallery.setViewMode(QListView.IconMode)
+        self.gallery.setResizeMode(QListView.Adjust)
+        self.gallery.setUniformItemSizes(True)
+        self.gallery.setLayoutMode(QListView.Batched)
+        self.gallery.setBatchSize(20)
         vbox.addWidget(self.gallery, 1)
-        self.refresh_gallery()
+        self._schedule_refresh("gallery")
 
         vbox.addStretch(); w = QWidget(); w.setLayout(vbox); return w
 
@@ -339,23 +368,27 @@ class ChatWindow(QMainWindow):
         self.worker.finished.connect(self.on_stream_finished)
         self.worker.start()
 
-        self.input_field.clear(); self.image_path = None; self.reply_buffer = ""; self.refresh_gallery()
+        self.input_field.clear(); self.image_path = None; self.reply_buffer = ""; self._schedule_refresh("gallery")
 
     # stream callbacks
     def append_streamed_token(self, token: str):
         self.reply_buffer += token
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _flush_tokens(self):
         self.current_bubble.txt.setText(self.reply_buffer)
         self.current_bubble.txt.adjustSize()  # пересчитать QLabel
         self.current_bubble.adjustSize()  # пересчитать весь пузырь
-        self.chat_layout.invalidate()  # перестроить layout
-
-        QApplication.processEvents()
+        self.current_bubble.updateGeometry()  # пометить грязным только этот пузырь
+        self._scroll_to_bottom()
 
     def on_stream_finished(self):
+        self._flush_timer.stop()
+        self._flush_tokens()  # дописать хвост, не дожидаясь таймера
         self.spinner_label.setVisible(False)
         append_message(self.chat_history, "user", self.last_user_text, image=self.last_user_image)
         append_message(self.chat_history, "assistant", self.reply_buffer)
-        save_history(self.chat_history)
 
 
     # ────────────────────────────────────────────────────────
@@ -363,12 +396,36 @@ class ChatWindow(QMainWindow):
     # -------------------------------------------------------
 
 
+    def _schedule_refresh(self, which: str):
+        """Запросить перестройку "gallery" и/или "list" в ближайшем тике event loop."""
+        self._pending_refresh.add(which)
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            QTimer.singleShot(0, self._do_refresh)
+
+    def _do_refresh(self):
+        pending, self._pending_refresh = self._pending_refresh, set()
+        self._refresh_pending = False
+        if "list" in pending:
+            self.refresh_chat_list()
+        if "gallery" in pending:
+            self.refresh_gallery()
+
     def refresh_gallery(self):
         self.gallery.clear()
         for path in list_chat_images(self.current_chat["file"]):
-            if not os.path.exists(path):
+            try:
+                key = (path, os.path.getmtime(path))
+            except OSError:
                 continue
-            icon = QIcon(QPixmap(path).scaled(self.THUMB_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            icon = self._thumb_cache.get(key)
+            if icon is None:
+                icon = QIcon(QPixmap(path).scaled(self.THUMB_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+                self._thumb_cache[key] = icon
+                if len(self._thumb_cache) > self.THUMB_CACHE_MAX:
+                    self._thumb_cache.popitem(last=False)
+            else:
+                self._thumb_cache.move_to_end(key)
             item = QListWidgetItem(icon, "")
             item.setData(Qt.UserRole, path)
             self.gallery.addItem(item)
@@ -400,7 +457,7 @@ class ChatWindow(QMainWindow):
         self.image_path = str(dest)
         html_img = f'<img src="{self.image_path}" width="300">'
         self._add_bubble("user", html_img)
-        self.refresh_gallery()
+        self._schedule_refresh("gallery")
 
     # ────────────────────────────────────────────────────────
     # Theme + chat management (unchanged vs previous)
@@ -415,11 +472,14 @@ class ChatWindow(QMainWindow):
 
     def apply_theme(self):
         qss_file = Path(__file__).parent / "themes" / ("dark.qss" if self.current_theme == "dark" else "light.qss")
-        try:
-            self.setStyleSheet(qss_file.read_text(encoding="utf-8"))
-        except FileNotFoundError:
-            log.warning("QSS not found: %s", qss_file)
-            self.setStyleSheet("")
+        qss = self._QSS_CACHE.get(qss_file.name)
+        if qss is None:
+            try:
+                qss = self._QSS_CACHE[qss_file.name] = qss_file.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                log.warning("QSS not found: %s", qss_file)
+                qss = ""
+        self.setStyleSheet(qss)
 
     # chat list helpers (same logic as before, omitted for brevity)
     def refresh_chat_list(self):
@@ -432,29 +492,47 @@ class ChatWindow(QMainWindow):
         self.switch_chat(item.data(Qt.UserRole))
 
     def create_and_switch_chat(self):
-        new_chat = create_new_chat(); self.switch_chat(new_chat); self.refresh_chat_list()
+        new_chat = create_new_chat(); self.switch_chat(new_chat); self._schedule_refresh("list")
 
     def switch_chat(self, chat: dict):
         self.current_chat = chat; set_current_chat(os.path.join("../chat_data", chat["file"]))
         self.chat_history = load_history();
         while self.chat_layout.count() > 1:
-            item = self.chat_layout.takeAt(0)
-            item.widget().deleteLater()
+            w = self.chat_layout.takeAt(0).widget()
+            w.hide()
+            self._bubble_pool.setdefault(w.role, []).append(w)
 
+        self.chat_container.setUpdatesEnabled(False)
         for m in self.chat_history:
-            self._add_bubble(m["role"], m["content"])
-        self.refresh_gallery()
+            self._add_bubble(m["role"], m["content"], defer_scroll=True)
+        self.chat_container.setUpdatesEnabled(True)
+        QTimer.singleShot(0, self._scroll_to_bottom)
+        self._schedule_refresh("gallery")
 
-    def _add_bubble(self, role: str, text: str, avatar_path: str | None = None):
+    def _scroll_to_bottom(self):
+        bar = self.scroll.verticalScrollBar()
+        bar.setValue(bar.maximum())
+
+    def _add_bubble(self, role: str, text: str, avatar_path: str | None = None,
+                    defer_scroll: bool = False):
         if avatar_path is None:
             avatar_path = USER_AVA if role == "user" else AI_AVA
-        avatar = QPixmap(avatar_path) if avatar_path else None
-        bubble = MessageBubble(text, role, avatar)
+        avatar = _AVATAR_CACHE.get(avatar_path)
+        if avatar is None and avatar_path:
+            avatar = QPixmap(avatar_path).scaled(36, 36, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            _AVATAR_CACHE[avatar_path] = avatar
+        pool = self._bubble_pool.get(role)
+        if pool:
+            bubble = pool.pop()
+            bubble.reset(text, role, avatar)
+            bubble.show()
+        else:
+            bubble = MessageBubble(text, role, avatar)
 
         # вставляем перед stretch‑заглушкой (‑1)
         self.chat_layout.insertWidget(self.chat_layout.count() - 1, bubble)
-        QTimer.singleShot(0, lambda: self.scroll.verticalScrollBar().setValue(
-            self.scroll.verticalScrollBar().maximum()))
+        if not defer_scroll:  # при массовой вставке скроллим один раз в конце
+            QTimer.singleShot(0, self._scroll_to_bottom)
         return bubble
 
     # ────────────────────────────────────────────────────────
@@ -482,8 +560,7 @@ class ChatWindow(QMainWindow):
             # ➌ Фиксируем результат
             append_message(self.chat_history, "assistant",
                            f"[{plugin.display_name} applied]", image=new_path)
-            save_history(self.chat_history)
-            self.refresh_gallery()
+            self._schedule_refresh("gallery")
 
         except Exception as exc:
             QMessageBox.critical(self, "Plugin error", str(exc))
@@ -499,10 +576,11 @@ class ChatWindow(QMainWindow):
         dlg = SettingsDialog(self)
         if dlg.exec_() == QDialog.Accepted:
             # применяем изменившиеся настройки
+            invalidate_models_cache()
             self.current_theme = AppSettings.theme().lower()
             self.apply_theme()
 
             # если пользователь сменил каталог chat_data,
             # перечитаем список диалогов
-            self.refresh_chat_list()
-            self.refresh_gallery()
\ No newline at end of file
+            self._schedule_refresh("list")
+            self._schedule_refresh("gallery")
\ No newline at end of file
@@ -15,16 +15,21 @@ from __future__ import annotations
 
 import os
 import sys
+import threading
 from pathlib import Path
 
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import QCoreApplication
 
-from ai_design_assistant.ui import main_window as mw
 from ai_design_assistant.core.settings import Settings
 from ai_design_assistant.core.logger import configure_logging
 
 
+def _warm_backends() -> None:
+    """Register LLM backends in the background while the UI is already up."""
+    from ai_design_assistant.core.models import load_builtin_backends
+    load_builtin_backends()
+
 
 def main() -> None:
     """Launch the Qt GUI application."""
@@ -47,11 +52,15 @@ def main() -> None:
     style = load_stylesheet(Settings.load().theme)
     app.setStyleSheet(style)
 
-    # 6️⃣ Main UI
+    # 6️⃣ Main UI (imported only after QApplication exists)
+    from ai_design_assistant.ui import main_window as mw
     win = mw.MainWindow()
     mw._MAIN_WINDOW = win
     win.show()
 
+    # 7️⃣ Heavy backend SDKs load while the user looks at the empty chat
+    threading.Thread(target=_warm_backends, name="warm-backends", daemon=True).start()
+
     sys.exit(app.exec())
 
 
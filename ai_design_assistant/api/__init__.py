@@ -2,12 +2,24 @@
 чтобы они сами зарегистрировались в глобальном роутере."""
 from importlib import import_module
 import logging
+import sys
 
 _LOGGER = logging.getLogger(__name__)
 
-for _name in ("openai_backend", "deepseek_backend", "local_backend", "local_qwen25_backend"):
+
+def cached_import(path: str):
+    """Вернуть уже загруженный модуль из sys.modules, иначе импортировать."""
+    module = sys.modules.get(path)
+    spec = getattr(module, "__spec__", None)
+    if module is not None and spec is not None and getattr(spec, "_initializing", False) is False:
+        return module
+    return import_module(path)
+
+
+for _name in ("openai_backend", "deepseek_backend", "local_backend", "local_qwen25_backend",
+              "local_vllm_backend"):
     try:
-        import_module(f"{__name__}.{_name}")
+        cached_import(f"{__name__}.{_name}")
     except Exception as exc:            # noqa: BLE001
         # не фатально: ключа может не быть, сервер может быть недоступен
         _LOGGER.warning("Skip %s – %s", _name, exc)
@@ -1,23 +1,138 @@
 """
-DeepSeek backend (пример, можно удалить если не нужен).
+DeepSeek backend (OpenAI-совместимый REST API).
 """
 
 from __future__ import annotations
 
-from typing import List
+import json
+import logging
+import os
+import threading
+from itertools import chain
+from typing import Iterator, List
 
-from ai_design_assistant.core.models import ModelBackend  # ← точечный импорт
+import httpx
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:                     # orjson необязателен
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+try:                                    # msgspec: типизированный decode SSE-чанка без промежуточных dict
+    import msgspec
+
+    class _Delta(msgspec.Struct):
+        content: str | None = None
+
+    class _Choice(msgspec.Struct):
+        delta: _Delta
+
+    class _Chunk(msgspec.Struct):
+        choices: list[_Choice]
+
+    _chunk_decoder = msgspec.json.Decoder(_Chunk)
+
+    def _chunk_content(data: bytes) -> str | None:
+        choices = _chunk_decoder.decode(data).choices
+        return choices[0].delta.content if choices else None
+except ImportError:
+    def _chunk_content(data: bytes) -> str | None:
+        return _loads(data)["choices"][0]["delta"].get("content")
+
+from ai_design_assistant.core.models import ModelBackend, normalize  # ← точечный импорт
+
+_LOGGER = logging.getLogger(__name__)
+
+_API_URL = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com").rstrip("/") + "/chat/completions"
+_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+_TIMEOUT = httpx.Timeout(60.0, connect=5.0)  # длинный read для стрима
+_LIMITS = httpx.Limits(max_connections=8, max_keepalive_connections=4)
+_TIMEOUT_WARMUP = httpx.Timeout(5.0)
+
+try:                                    # HTTP/2 требует пакет h2 (httpx[http2])
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
-# здесь могла бы быть import deepseek …
 
 class _DeepSeekBackend(ModelBackend):
     name = "deepseek"
 
+    def __init__(self) -> None:
+        self._headers = {"Content-Type": "application/json"}
+        # один клиент на всё время жизни процесса: keep-alive + мультиплексирование HTTP/2
+        self._client = httpx.Client(
+            http2=_HTTP2,
+            headers=self._headers,
+            timeout=_TIMEOUT,
+            limits=_LIMITS,
+            transport=httpx.HTTPTransport(http2=_HTTP2, limits=_LIMITS, retries=2),
+        )
+        self._warm = False              # прогрев — не при импорте, а при выборе провайдера
+
+    def warmup(self) -> None:
+        """TCP+TLS(+ALPN h2) рукопожатие заранее, в фоне — первый запрос не платит лишний RTT."""
+        if self._warm or not os.getenv("DEEPSEEK_API_KEY"):
+            return
+        self._warm = True
+        threading.Thread(target=self._head, name="deepseek-warmup", daemon=True).start()
+
+    def _head(self) -> None:
+        try:
+            self._client.head(_API_URL, timeout=_TIMEOUT_WARMUP)
+        except httpx.HTTPError as exc:   # не критично: соединение откроет первый запрос
+            _LOGGER.debug("DeepSeek warm-up failed: %s", exc)
+
+    def _s(self) -> httpx.Client:
+        # ключ мог поменяться через SettingsDialog → читаем при каждом запросе
+        key = os.getenv("DEEPSEEK_API_KEY")
+        if not key:
+            raise RuntimeError("DEEPSEEK_API_KEY missing – backend disabled")
+        self._client.headers["Authorization"] = f"Bearer {key}"
+        return self._client
+
     def generate(self, messages: List[dict[str, str]], **kw) -> str:  # noqa: D401
-        raise NotImplementedError("DeepSeek SDK ещё не подключён")
+        payload = {"model": _MODEL, "messages": normalize(messages), **kw}
+        # сериализуем сами (orjson) и отдаём готовые байты — httpx не вызывает json.dumps
+        resp = self._s().post(_API_URL, content=_dumps(payload))
+        resp.raise_for_status()
+        # сырые байты сразу в orjson — без resp.text и stdlib json
+        return _loads(resp.content)["choices"][0]["message"]["content"] or ""
+
+    def stream(self, messages: List[dict[str, str]], **kw) -> Iterator[str]:
+        payload = {"model": _MODEL, "messages": normalize(messages), "stream": True, **kw}
+        with self._s().stream("POST", _API_URL, content=_dumps(payload)) as resp:
+            resp.raise_for_status()
+            # горячий цикл: локальные имена вместо глобальных/атрибутных lookup'ов
+            chunk_content = _chunk_content
+            prefix = b"data: "
+            buf = bytearray()
+            # завершающий b"\n\n" дочитывает последнее событие, если сервер закрыл поток без него
+            for chunk in chain(resp.iter_bytes(chunk_size=4096), (b"\n\n",)):
+                buf.extend(chunk)
+                while (i := buf.find(b"\n\n")) != -1:
+                    event = bytes(buf[:i])
+                    del buf[:i + 2]
+                    for line in event.split(b"\n"):
+                        if line[:6] != prefix:
+                            continue
+                        data = line[6:]
+                        if data == b"[DONE]":
+                            return
+                        content = chunk_content(data)
+                        if content:
+                            yield content
+
 
 backend = _DeepSeekBackend()
 
 def summarize_chat(prompt: str) -> str:
-    """Суммаризация чата через DeepSeek (заглушка)."""
-    raise NotImplementedError("DeepSeek пока не поддерживает суммаризацию в нашем приложении.")
+    """Суммаризация чата через DeepSeek."""
+    messages = [{"role": "user", "content": prompt}]
+    return backend.generate(messages)
@@ -1,13 +1,17 @@
 # ai_design_assistant/api/local_backend.py
 from __future__ import annotations
 
+import functools
+import gc
 import os
+import shutil
+import tempfile
 import threading
 from pathlib import Path
 from typing import Iterator, List
 
-import base64
 from io import BytesIO
+import numpy as np
 from PIL import Image
 
 import torch
@@ -23,88 +27,169 @@ from ai_design_assistant.core.settings import Settings
 
 _LOGGER = logging.getLogger(__name__)
 
-from ai_design_assistant.core.models import ModelBackend, normalize
+from ai_design_assistant.core.local_runtime import (
+    ATTN_IMPL,
+    DEVICE,
+    DTYPE,
+    TJ,
+    TJPF_RGB,
+    TORCH_COMPILE,
+    LocalHFBackend,
+    base64,
+    compile_decode,
+    generate_no_grad,
+    prepare_processor,
+    to_device,
+)
+from ai_design_assistant.core.models import coalesce
 
 # ──────────────────────────────────────────────────────────────────
 _MODEL_NAME = os.getenv("LOCAL_MODEL_NAME", "neulab/Pangea-7B-hf")
-_DEVICE     = "cuda" if torch.cuda.is_available() else "cpu"
-_DTYPE      = torch.float16 if _DEVICE == "cuda" else torch.float32
 _MAX_TOKENS = int(os.getenv("LOCAL_MAX_NEW_TOKENS", "512"))
+# крупнейшая сетка anyres у LLaVA-NeXT ≈ 1344 px — больше процессору не нужно
+_MAX_IMAGE_SIDE = int(os.getenv("LOCAL_MAX_IMAGE_SIDE", "1344"))
+# копия модели с эмбеддингами под размер токенизатора (safetensors, грузится через mmap)
+_RESIZED_DIR = Path(os.getenv(
+    "LOCAL_RESIZED_MODEL_DIR",
+    Path.home() / ".cache" / "ai_design_assistant" / _MODEL_NAME.replace("/", "--"),
+))
+_RESIZED_DONE = ".complete"     # маркер целой копии: пишется последним, после всех шардов
 # ──────────────────────────────────────────────────────────────────
 
 
-def _prepare_processor(proc, patch_size: int = 14) -> None:
-    """Гарантируем, что у процессора выставлен patch_size (некоторые версии HF опускают поле)."""
-    if getattr(proc, "patch_size", None) is None:
-        proc.patch_size = patch_size
-    if getattr(proc.image_processor, "patch_size", None) is None:
-        proc.image_processor.patch_size = patch_size
-
-def _decode_data_url(data_url: str) -> Image.Image:
-    """data:image/...;base64,.... → PIL.Image"""
+def _memoize_feature_count(proc) -> None:
+    """Число <image>-плейсхолдеров зависит только от размеров картинки — кэшируем расчёт."""
+    fn = getattr(proc, "_get_number_of_features", None)
+    if fn is not None:                  # LlavaNextProcessor; атрибут экземпляра перекрывает метод класса
+        proc._get_number_of_features = functools.lru_cache(maxsize=64)(fn)
+
+
+def _save_resized(model) -> None:
+    """Сохранить копию с подогнанными эмбеддингами в _RESIZED_DIR — целиком или никак.
+
+    Пишем во временную папку рядом и переносим через os.replace только после
+    маркера: оборванная запись (выход, нехватка места) не оставит копию,
+    которую следующий запуск примет за готовую.
+    """
+    need = model.get_memory_footprint()
+    parent = _RESIZED_DIR.parent
+    parent.mkdir(parents=True, exist_ok=True)
+    free = shutil.disk_usage(parent).free
+    if free < need * 1.1:
+        _LOGGER.warning(
+            "Кэш модели не сохранён: нужно ~%.1f GB, свободно %.1f GB в %s",
+            need / 1e9, free / 1e9, parent,
+        )
+        return
+    _LOGGER.info("💾 Сохраняю модель с подогнанными эмбеддингами (~%.1f GB) в %s", need / 1e9, _RESIZED_DIR)
+    tmp = Path(tempfile.mkdtemp(prefix=f"{_RESIZED_DIR.name}.", suffix=".part", dir=parent))
+    try:
+        model.save_pretrained(tmp, safe_serialization=True)
+        (tmp / _RESIZED_DONE).touch()
+        if _RESIZED_DIR.exists():       # недописанная копия от прошлых версий
+            shutil.rmtree(_RESIZED_DIR)
+        os.replace(tmp, _RESIZED_DIR)
+    except OSError as exc:              # не критично: модель уже в памяти, в следующий раз попробуем снова
+        _LOGGER.warning("Кэш модели не сохранён (%s): %s", _RESIZED_DIR, exc)
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+    if (_RESIZED_DIR / _RESIZED_DONE).exists():
+        used = sum(f.stat().st_size for f in _RESIZED_DIR.iterdir() if f.is_file())
+        _LOGGER.info("💾 Кэш модели: %s — %.1f GB на диске", _RESIZED_DIR, used / 1e9)
+
+
+def _decode_jpeg_turbo(raw: bytes, max_side: int) -> np.ndarray:
+    """JPEG → RGB ndarray; берём самый мелкий DCT-масштаб, который ещё ≥ *max_side*."""
+    width, height, _, _ = TJ.decode_header(raw)
+    longest = max(width, height)
+    scale = (1, 1)
+    for num, den in TJ.scaling_factors:
+        if longest * num // den >= max_side and num * scale[1] < scale[0] * den:
+            scale = (num, den)
+    return TJ.decode(raw, pixel_format=TJPF_RGB, scaling_factor=scale)
+
+
+def _preprocess_image(data_url: str, max_side: int = _MAX_IMAGE_SIDE) -> Image.Image | np.ndarray:
+    """data:image/...;base64,.... → RGB-картинка, не больше *max_side* по длинной стороне.
+
+    JPEG сразу декодируется в уменьшенном масштабе (DCT-scaling libjpeg:
+    turbojpeg, если есть, иначе ``draft`` у Pillow), поэтому процессор не
+    тратит время на ресайз огромных фото. Процессор принимает и PIL, и ndarray.
+    """
     if "," in data_url:
         data_url = data_url.split(",", 1)[1]
-    img_bytes = base64.b64decode(data_url)
-    return Image.open(BytesIO(img_bytes)).convert("RGB")
+    raw = base64.b64decode(data_url)
+    if TJ is not None and raw[:3] == b"\xff\xd8\xff":
+        arr = _decode_jpeg_turbo(raw, max_side)
+        if max(arr.shape[:2]) <= max_side:
+            return arr
+        img = Image.fromarray(arr)
+    else:
+        img = Image.open(BytesIO(raw))
+        if max(img.size) > max_side:
+            img.draft("RGB", (max_side, max_side))  # для не-JPEG — no-op
+        if img.mode == "RGB":           # convert("RGB") копировал бы уже готовый буфер
+            img.load()
+        else:
+            img = img.convert("RGB")
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BICUBIC, reducing_gap=2.0)
+    return img
+
+
+def _decode_data_url(data_url: str) -> Image.Image | np.ndarray:
+    """data:image/...;base64,.... → PIL.Image / RGB ndarray"""
+    return _preprocess_image(data_url)
+
 
 def _collapse_messages(messages: List[dict]):
     """Возвращает ([messages], image | None) — и берёт картинку только из последнего user-сообщения."""
-    image: Image.Image | None = None
     out = []
+    append = out.append
+    last_image_url: str | None = None
 
+    # один проход: текст склеиваем сразу, URL последней картинки просто запоминаем
     for m in messages:
         content = m["content"]
 
-        if isinstance(content, list):
+        if type(content) is list:       # normalize() отдаёт обычные list — без обхода MRO
             parts = []
+            msg_image_url = None
             for chunk in content:
-                if chunk["type"] == "text":
-                    parts.append(chunk["text"])
-                elif chunk["type"] == "image_url":
-                    parts.append("<image>")   # всегда добавляем <image>
+                match chunk["type"]:
+                    case "text":
+                        parts.append(chunk["text"])
+                    case "image_url":
+                        parts.append("<image>")   # всегда добавляем <image>
+                        msg_image_url = msg_image_url or chunk["image_url"]["url"]
             content = " ".join(parts)
+            if msg_image_url:               # первая картинка последнего сообщения с картинками
+                last_image_url = msg_image_url
 
-        out.append({"role": m["role"], "content": content})
-
-    # Найти последнюю картинку в истории сообщений
-    for m in reversed(messages):
-        content = m["content"]
-        if isinstance(content, list):
-            for chunk in content:
-                if chunk["type"] == "image_url":
-                    image = _decode_data_url(chunk["image_url"]["url"])
-                    break
-        if image:
-            break
+        append({"role": m["role"], "content": content})
 
+    # декодируем ровно одну картинку, сколько бы их ни было в истории
+    image = _decode_data_url(last_image_url) if last_image_url else None
     return out, image
 
 
 def _build_inputs(self, messages):
     msgs, image = _collapse_messages(messages)
-    prompt = self.tokenizer.apply_chat_template(
-        msgs, tokenize=False, add_generation_prompt=True
-    )
+    prompt = self._apply_template(msgs, add_generation_prompt=True)
     if image is None:          # старый путь (text-only)
         batch = self.tokenizer(prompt, return_tensors="pt")
     else:                      # текст + картинка
         batch = self.processor(text=prompt, images=image, return_tensors="pt")
-    return {k: v.to(_DEVICE) for k, v in batch.items()}
+    return to_device(batch, DEVICE)
 
 
-class _LocalBackend(ModelBackend):
+class _LocalBackend(LocalHFBackend):
     name = "local"
 
-    def __init__(self) -> None:
-        super().__init__()
-
-        # Настройка, которую пользователь задаёт в Settings
-        self.unload_mode = Settings.load().local_unload_mode   # 'none' | 'cpu' | 'full'
-
-        # Ничего тяжёлого здесь не создаём — всё появится в _maybe_reload_model()
-        self.model: LlavaNextForConditionalGeneration | None = None
-        self.processor: AutoProcessor | None = None
-        self.tokenizer = None
+    # модель появится в _maybe_reload_model(), режим выгрузки читает unload_model()
+    model: LlavaNextForConditionalGeneration | None
+    processor: AutoProcessor | None
 
     def unload_model(self) -> None:
         # Модель ещё не загружали — выгружать нечего
@@ -122,20 +207,17 @@ class _LocalBackend(ModelBackend):
             if torch.cuda.is_available():
                 used_before = torch.cuda.memory_allocated() / (1024 ** 2)
                 self.model.to("cpu")
+                gc.collect()                # сначала отпускаем ссылки, потом — кэш аллокатора
                 torch.cuda.empty_cache()
-                import gc
-                gc.collect()
                 used_after = torch.cuda.memory_allocated() / (1024 ** 2)
                 _LOGGER.info(f"🔋 Модель выгружена в RAM. VRAM до: {used_before:.2f} MB → после: {used_after:.2f} MB")
         elif unload_mode == "full":
             if torch.cuda.is_available():
                 used_before = torch.cuda.memory_allocated() / (1024 ** 2)
-                torch.cuda.empty_cache()
                 _LOGGER.info(f"🗑️ Модель удалена полностью. VRAM было: {used_before:.2f} MB")
             del self.model
             del self.processor
             del self.tokenizer
-            import gc
             gc.collect()
             torch.cuda.empty_cache()
             torch.cuda.ipc_collect()
@@ -145,48 +227,65 @@ class _LocalBackend(ModelBackend):
         """Перезагрузить модель при необходимости."""
         if self.model is None:
             _LOGGER.info("⏳ Загрузка модели с диска...")
+            # если эмбеддинги уже подгоняли под токенизатор — берём сохранённую копию
+            source = _RESIZED_DIR if (_RESIZED_DIR / _RESIZED_DONE).exists() else _MODEL_NAME
+            # safetensors mmap'ятся и шард за шардом уходят прямо на устройство —
+            # без промежуточной полной копии в RAM и без отдельного .to(DEVICE)
             self.model = LlavaNextForConditionalGeneration.from_pretrained(
-                _MODEL_NAME, torch_dtype=_DTYPE
-            ).to(_DEVICE)
+                source,
+                torch_dtype=DTYPE,
+                attn_implementation=ATTN_IMPL,
+                device_map={"": DEVICE},
+                low_cpu_mem_usage=True,
+            )
             _LOGGER.info("✅ Модель загружена.")
 
             self.processor = AutoProcessor.from_pretrained(_MODEL_NAME)
             self.tokenizer = self.processor.tokenizer
-            self.model.resize_token_embeddings(len(self.tokenizer))
-
-            _prepare_processor(self.processor)
-
-        elif next(self.model.parameters()).device != torch.device(_DEVICE):
-            _LOGGER.info(f"🔄 Перемещаю модель обратно на {_DEVICE}")
-            self.model.to(_DEVICE)
+            # словарь модели обычно дополнен до кратного 64/128 — лишние строки не мешают;
+            # resize (копия эмбеддингов и LM-head) нужен, только если токенов не хватает
+            if self.model.get_input_embeddings().weight.shape[0] < len(self.tokenizer):
+                # делаем один раз и кэшируем на диск
+                self.model.resize_token_embeddings(len(self.tokenizer))
+                _save_resized(self.model)
+
+            prepare_processor(self.processor)
+            _memoize_feature_count(self.processor)
+            self._init_template(self.tokenizer)
+            if TORCH_COMPILE:
+                compile_decode(self.model, self.tokenizer)
+
+        elif next(self.model.parameters()).device != torch.device(DEVICE):
+            _LOGGER.info(f"🔄 Перемещаю модель обратно на {DEVICE}")
+            self.model.to(DEVICE)
 
     # --- базовый sync-режим (вернуть строку цельным куском) -----------------
     def generate(self, messages: List[dict[str, str]], **kw) -> str:
-        self._maybe_reload_model()
-        batch = _build_inputs(self, messages)
-        output = self.model.generate(**batch, max_new_tokens=_MAX_TOKENS)
-        gen_ids = output[0][batch["input_ids"].shape[1]:]
-        self.unload_model()  # <-- после генерации выгружаем
-        return self.tokenizer.decode(gen_ids, skip_special_tokens=True)
+        with self._idle.busy():
+            with self._model_lock:
+                self._maybe_reload_model()
+            batch = _build_inputs(self, messages)
+            output = generate_no_grad(self.model, **batch, max_new_tokens=_MAX_TOKENS)
+            gen_ids = output[0][batch["input_ids"].shape[1]:]
+            return self.tokenizer.decode(gen_ids, skip_special_tokens=True)
 
     # --- потоковая версия (вернёт итератор токенов) --------------------------
     def stream(self, messages: List[dict[str, str]], **kw) -> Iterator[str]:
-        self._maybe_reload_model()
-        batch = _build_inputs(self, messages)
-
-        streamer = TextIteratorStreamer(
-            self.tokenizer, skip_prompt=True, skip_special_tokens=True
-        )
-        gen_kwargs = dict(**batch, streamer=streamer, max_new_tokens=_MAX_TOKENS)
+        with self._idle.busy():
+            with self._model_lock:
+                self._maybe_reload_model()
+            batch = _build_inputs(self, messages)
 
-        threading.Thread(
-            target=self.model.generate, kwargs=gen_kwargs, daemon=True
-        ).start()
+            streamer = TextIteratorStreamer(
+                self.tokenizer, skip_prompt=True, skip_special_tokens=True
+            )
+            gen_kwargs = dict(**batch, streamer=streamer, max_new_tokens=_MAX_TOKENS)
 
-        for token in streamer:
-            yield token
+            threading.Thread(
+                target=generate_no_grad, args=(self.model,), kwargs=gen_kwargs, daemon=True
+            ).start()
 
-        self.unload_model()  # <-- после стрима выгружаем
+            yield from coalesce(streamer)
 
 
 # Экспортим объект, чтобы api.__init__ смог зарегистрировать бекенд
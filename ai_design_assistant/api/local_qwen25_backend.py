@@ -1,22 +1,43 @@
 # ai_design_assistant/api/local_qwen25_backend.py
 from __future__ import annotations
-import os, threading, base64, logging
+import os, threading, logging, hashlib, json, gc, queue, time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from io import BytesIO
 from typing import Iterator, List
 
 from PIL import Image
+
 from qwen_vl_utils import process_vision_info
 import torch
 from transformers import (
     Qwen2_5_VLForConditionalGeneration,
     AutoProcessor,
     TextIteratorStreamer,
-    BitsAndBytesConfig
+    StoppingCriteria,
+    StoppingCriteriaList,
+    StopStringCriteria,
+    BitsAndBytesConfig,
+    GPTQConfig,
 )
 
 from ai_design_assistant.core.settings import Settings
-from ai_design_assistant.core.models import ModelBackend, normalize
+from ai_design_assistant.core.local_runtime import (
+    ATTN_IMPL,
+    DEVICE,
+    DTYPE,
+    TJ,
+    TJPF_RGB,
+    TORCH_COMPILE,
+    LocalHFBackend,
+    base64,
+    compile_decode,
+    generate_no_grad,
+    prepare_processor,
+    to_device,
+)
+from ai_design_assistant.core.models import coalesce, normalize
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -27,27 +48,139 @@ _MODEL_NAME = os.getenv(
     "LOCAL_MODEL_NAME",               # можно переопределить переменной окружения
     "Qwen/Qwen2.5-VL-3B-Instruct",
 )
-_DEVICE     = "cuda" if torch.cuda.is_available() else "cpu"
-_DTYPE      = torch.float16 if _DEVICE == "cuda" else torch.float32
 _MAX_TOKENS = int(os.getenv("LOCAL_MAX_NEW_TOKENS", "1024"))
+# готовые INT4-чекпойнты для Settings.local_quant_backend (vision-башня в них остаётся FP16)
+_QUANT_MODEL_NAMES = {
+    "awq": os.getenv("LOCAL_AWQ_MODEL_NAME", f"{_MODEL_NAME}-AWQ"),
+    "gptq-marlin": os.getenv("LOCAL_GPTQ_MODEL_NAME", f"{_MODEL_NAME}-GPTQ-Int4"),
+}
+# LOCAL_QUANT=nf4|int8|none — перекрывает Settings.local_quant_backend (читается один раз)
+_QUANT_ENV = {"nf4": "bnb-nf4", "int8": "bnb-int8", "none": "none"}.get(
+    os.getenv("LOCAL_QUANT", "").lower(), ""
+)
+_MIN_PIXELS = 28 * 28          # ≈ 1 визуальный токен
+_MAX_PIXELS = 1280 * 28 * 28   # как в примере
+_PROMPT_CACHE_MAX = 64         # сколько токенизированных префиксов истории держим
+_STREAM_QUEUE_MAX = 256        # столько кусков текста генерация может обогнать читателя
+_STREAM_TIMEOUT = 120.0        # сек. ожидания на put/get стримера — потом генерация прерывается
+_VRAM_LOG = os.getenv("LOCAL_VRAM_LOG", "0") == "1"   # замер VRAM при выгрузке (с synchronize)
+_SYSTEM_PROMPT = (
+    "Ты — ИИ-ассистент по графическому дизайну. "
+    "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX "
+    "или на эстетике кадра. Отвечай кратко и по существу."
+)
+# общий dict на все запросы — не изменяем его
+_SYSTEM_MSG = {"role": "system", "content": _SYSTEM_PROMPT}
 # ───────────────────────────────────────────
 
+def _decode_jpeg_turbo(raw: bytes, max_pixels: int) -> Image.Image:
+    """JPEG → PIL.Image (RGB); самый мелкий DCT-масштаб, который ещё ≥ *max_pixels*."""
+    width, height, _, _ = TJ.decode_header(raw)
+    scale = (1, 1)
+    for num, den in TJ.scaling_factors:
+        if (width * num // den) * (height * num // den) >= max_pixels and num * scale[1] < scale[0] * den:
+            scale = (num, den)
+    # fromarray над C-contiguous uint8 — без лишней копии и без .convert("RGB")
+    return Image.fromarray(TJ.decode(raw, pixel_format=TJPF_RGB, scaling_factor=scale))
+
+
+def _preprocess_image(source: str, max_pixels: int = _MAX_PIXELS) -> Image.Image:
+    """data-URL или путь к файлу → PIL.Image (RGB).
+
+    JPEG декодируется сразу в уменьшенном масштабе (turbojpeg, если есть,
+    иначе ``draft`` у Pillow), но не ниже бюджета *max_pixels*: точный
+    smart_resize всё равно сделает qwen_vl_utils.
+    """
+    if source.startswith("data:"):
+        raw = base64.b64decode(source.split(",", 1)[1])
+    else:
+        with open(source, "rb") as f:
+            raw = f.read()
+    if TJ is not None and raw[:3] == b"\xff\xd8\xff":
+        return _decode_jpeg_turbo(raw, max_pixels)
+    img = Image.open(BytesIO(raw))
+    w, h = img.size
+    if w * h > max_pixels:
+        scale = (max_pixels / (w * h)) ** 0.5
+        img.draft("RGB", (int(w * scale) + 1, int(h * scale) + 1))
+    if img.mode == "RGB":           # convert("RGB") копировал бы уже готовый буфер
+        img.load()                  # декодируем здесь, в пуле, а не лениво в processor
+        return img
+    return img.convert("RGB")
+
+
+def _message_key(prev: bytes, message: dict, pads: List[int]) -> bytes:
+    """Цепной хэш: ключ префикса истории, заканчивающегося на *message* (HF-формат).
+
+    Картинка входит в ключ только числом своих <|image_pad|>-токенов: шаблон
+    выводит вместо неё плейсхолдер, так что сами пиксели на input_ids не влияют
+    и base64-данные хэшировать не нужно.
+    """
+    pads = iter(pads)
+    parts = [message["role"]]
+    for block in message["content"]:
+        parts.append(next(pads) if block["type"] == "image" else block.get("text", ""))
+    data = json.dumps(parts, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(prev + data, digest_size=16).digest()
+
+
+def _gather_images(raw_messages: List[dict]) -> List[str]:
+    """Все источники картинок (data-URL или путь) в порядке появления."""
+    sources = []
+    for m in raw_messages:
+        content = m["content"]
+        if isinstance(content, list):
+            sources.extend(c["image_url"]["url"] for c in content if c["type"] == "image_url")
+        elif m.get("image"):
+            sources.append(str(Path(m["image"])))
+    return sources
+
+
+# постоянные пулы: _PREFETCH стартует декодирование, пока грузится/прогревается модель,
+# _DECODE_POOL параллелит сами картинки (вложенный submit в тот же пул мог бы зависнуть)
+_PREFETCH = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qwen-prefetch")
+_DECODE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="qwen-decode")
+_IMAGE_CACHE_MAX = 16
+_IMAGE_CACHE: OrderedDict[tuple, Image.Image] = OrderedDict()
+_IMAGE_CACHE_LOCK = threading.Lock()
+
+
+def _image_key(source: str) -> tuple:
+    if source.startswith("data:"):
+        return ("data", hashlib.sha256(source.encode("ascii", "ignore")).digest())
+    return ("file", source, os.stat(source).st_mtime_ns)
 
-def _prepare_processor(proc, patch_size: int = 14):
-    """У Qwen-VL уже есть patch_size, но оставим проверку."""
-    if getattr(proc, "patch_size", None) is None:
-        proc.patch_size = patch_size
-    if getattr(proc.image_processor, "patch_size", None) is None:
-        proc.image_processor.patch_size = patch_size
 
+def _cached_preprocess(source: str) -> Image.Image:
+    """_preprocess_image с LRU: в чате одна и та же картинка приходит каждый ход."""
+    key = _image_key(source)
+    with _IMAGE_CACHE_LOCK:
+        img = _IMAGE_CACHE.get(key)
+        if img is not None:
+            _IMAGE_CACHE.move_to_end(key)
+            return img
+    img = _preprocess_image(source)
+    with _IMAGE_CACHE_LOCK:
+        _IMAGE_CACHE[key] = img
+        while len(_IMAGE_CACHE) > _IMAGE_CACHE_MAX:
+            _IMAGE_CACHE.popitem(last=False)
+    return img
 
-def _decode_data_url(data_url: str) -> str:
-    # ничего не декодируем, просто возвращаем строку
-    return data_url
 
+def _decode_images(sources: List[str]) -> dict[str, Image.Image]:
+    """Декодировать уникальные источники параллельно (Pillow отпускает GIL)."""
+    unique = list(dict.fromkeys(sources))  # propagate_last_image дублирует одну и ту же картинку
+    if len(unique) <= 1:
+        return {src: _cached_preprocess(src) for src in unique}
+    return dict(zip(unique, _DECODE_POOL.map(_cached_preprocess, unique)))
 
 
-def _collapse_messages(raw_messages: List[dict]):
+def _decode_images_async(raw_messages: List[dict]) -> Future:
+    """Future[{источник: PIL.Image}] — результат забираем прямо перед processor()."""
+    return _PREFETCH.submit(_decode_images, _gather_images(raw_messages))
+
+
+def _collapse_messages(raw_messages: List[dict], images: dict[str, Image.Image]):
     hf_msgs = []
     for m in raw_messages:
         role = m["role"]
@@ -57,10 +190,10 @@ def _collapse_messages(raw_messages: List[dict]):
         if isinstance(content, list):
             for chunk in content:
                 if chunk["type"] == "image_url":
-                    # ⬇️  Заменяем на блок type="image" со строкой-URL
+                    # ⬇️  Заменяем на блок type="image" с уже декодированной картинкой
                     blocks.append({
                         "type": "image",
-                        "image": chunk["image_url"]["url"]    # ← строка URL
+                        "image": images[chunk["image_url"]["url"]],
                     })
                 else:         # {"type": "text", …}
                     blocks.append(chunk)
@@ -69,7 +202,7 @@ def _collapse_messages(raw_messages: List[dict]):
             if m.get("image"):          # локальный файл
                 blocks.append({
                     "type": "image",
-                    "image": str(Path(m["image"]))            # строковый путь
+                    "image": images[str(Path(m["image"]))],
                 })
 
         hf_msgs.append({"role": role, "content": blocks})
@@ -81,13 +214,18 @@ def _collapse_messages(raw_messages: List[dict]):
 
 
 
-def _build_inputs(self, messages):
-    hf_msgs, image_inputs, video_inputs = _collapse_messages(messages)
+def _build_inputs(self, messages, images: Future):
+    hf_msgs, image_inputs, video_inputs = _collapse_messages(messages, images.result())
+    device = next(self.model.parameters()).device
+
+    # основной путь: input_ids истории — из кэша, processor считает только pixel_values
+    if not video_inputs:
+        inputs = self._cached_inputs(hf_msgs, image_inputs)
+        if inputs is not None:
+            return to_device(inputs, device)
 
     # 1) текст с <img> токенами
-    prompt = self.processor.apply_chat_template(
-        hf_msgs, tokenize=False, add_generation_prompt=True
-    )
+    prompt = self._apply_template(hf_msgs, tokenize=False, add_generation_prompt=True)
     _LOGGER.debug(f"Prompt →\n{prompt}")
 
     # 2) в один вызов processor
@@ -102,12 +240,42 @@ def _build_inputs(self, messages):
     if video_inputs:  # есть хотя бы одно видео
         proc_kwargs["videos"] = video_inputs
 
+    # system-подсказка постоянна: её токены посчитаны при загрузке модели,
+    # процессору отдаём только остаток (граница — спец-токен, токенизация не меняется)
+    sys_text, sys_ids = self._sys_prefix
+    cached_sys = sys_ids is not None and prompt.startswith(sys_text)
+    if cached_sys:
+        proc_kwargs["text"] = [prompt[len(sys_text):]]
+
     inputs = self.processor(**proc_kwargs)
+    if cached_sys:
+        inputs["input_ids"] = torch.cat([sys_ids, inputs["input_ids"]], dim=1)
+        inputs["attention_mask"] = torch.cat(
+            [torch.ones_like(sys_ids), inputs["attention_mask"]], dim=1
+        )
 
     # 3) к тому же устройству
-    device = next(self.model.parameters()).device
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-    return inputs
+    return to_device(inputs, device)
+
+
+class _StopFlag(StoppingCriteria):
+    """Останавливает generate на следующем шаге, когда вызывающий бросил стрим."""
+
+    def __init__(self, event: threading.Event) -> None:
+        self._event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        stop = self._event.is_set()
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+
+def _drain(q: queue.Queue) -> None:
+    """Выбросить всё, что лежит в очереди, не блокируясь."""
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
 
 
 def propagate_last_image(messages: list[dict]) -> list[dict]:
@@ -132,46 +300,217 @@ def propagate_last_image(messages: list[dict]) -> list[dict]:
     return new_messages
 
 
-class _LocalQwenBackend(ModelBackend):
+class _LocalQwenBackend(LocalHFBackend):
     name = "local_qwen25"
 
+    # модель грузится лениво в _maybe_reload_model()
+    model: Qwen2_5_VLForConditionalGeneration | None
+    processor: AutoProcessor | None
+
     def __init__(self) -> None:
         super().__init__()
-        self.unload_mode = Settings.load().local_unload_mode  # 'none' | 'cpu' | 'full'
-        self.model: Qwen2_5_VLForConditionalGeneration | None = None
-        self.processor: AutoProcessor | None = None
-        self.tokenizer = None
+        # ключ префикса истории → его input_ids (1-D, без generation prompt);
+        # None — шаблон не раскладывается по сообщениям, кэш выключен
+        self._prefix_cache: dict[bytes, torch.Tensor] | None = {}
+        self._cache_lock = threading.Lock()     # generate/stream зовут из разных потоков
+        # (отрендеренная system-подсказка, её input_ids) и input_ids generation prompt —
+        # заполняются при загрузке процессора
+        self._sys_prefix: tuple[str, torch.Tensor | None] = ("", None)
+        self._gen_prompt_ids: torch.Tensor | None = None
+        # один постоянный поток под model.generate вместо нового Thread на каждый stream()
+        self._gen_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qwen-generate")
 
     # ---------------- helpers -----------------
+    def _piece_ids(self, text: str, pads: List[int]) -> torch.Tensor:
+        """Кусок шаблона → input_ids; каждый <|image_pad|> раскрывается в pads[i] токенов,
+        как это делает processor."""
+        token = self.processor.image_token
+        parts = text.split(token)
+        if len(parts) != len(pads) + 1:
+            raise ValueError("число плейсхолдеров не совпадает с числом картинок")
+        text = "".join(part + token * n for part, n in zip(parts, pads)) + parts[-1]
+        return self.tokenizer(text, return_tensors="pt", add_special_tokens=False).input_ids[0]
+
+    def _cached_inputs(self, hf_msgs: List[dict], image_inputs) -> dict | None:
+        """input_ids из кэша токенизированных префиксов истории; токенизируем только новые сообщения.
+
+        ChatML рендерит каждое сообщение независимо, поэтому кусок сообщения *m*
+        берём как render([system, m]) минус render([system]). None — кэш выключен,
+        вызывающий идёт через полный processor.
+        """
+        sys_text, sys_ids = self._sys_prefix
+        if self._prefix_cache is None or sys_ids is None or hf_msgs[0]["role"] != "system":
+            return None
+
+        vision, pads = {}, []
+        if image_inputs:                    # пиксели — каждый раз, токены картинок — по сетке патчей
+            vision = dict(self.processor.image_processor(images=image_inputs, return_tensors="pt"))
+            merge = self.processor.image_processor.merge_size ** 2
+            pads = (vision["image_grid_thw"].prod(-1) // merge).tolist()
+
+        keys, msg_pads, key, pos = [], [], b"", 0
+        for m in hf_msgs:
+            n = sum(block["type"] == "image" for block in m["content"])
+            msg_pads.append(pads[pos:pos + n])
+            pos += n
+            key = _message_key(key, m, msg_pads[-1])
+            keys.append(key)
+
+        start, prefix = 1, None
+        with self._cache_lock:
+            if self._prefix_cache is None:
+                return None
+            for i in range(len(keys) - 1, 0, -1):   # самый длинный известный префикс
+                prefix = self._prefix_cache.get(keys[i])
+                if prefix is not None:
+                    start = i + 1
+                    break
+        cold = prefix is None
+
+        pieces, new = [sys_ids[0] if cold else prefix], {}
+        try:
+            for i in range(start, len(hf_msgs)):
+                text = self._apply_template(
+                    [hf_msgs[0], hf_msgs[i]], tokenize=False, add_generation_prompt=False
+                )
+                pieces.append(self._piece_ids(text[len(sys_text):], msg_pads[i]))
+                new[keys[i]] = torch.cat(pieces)
+                pieces = [new[keys[i]]]
+        except ValueError:
+            cold, new = True, None
+        input_ids = torch.cat([*pieces, self._gen_prompt_ids])[None]
+
+        if cold:  # сверяемся с полным processor один раз на новую историю
+            full = self.processor(
+                text=[self._apply_template(hf_msgs, tokenize=False, add_generation_prompt=True)],
+                images=image_inputs or None,
+                padding=True,
+                return_tensors="pt",
+            )
+            if new is None or not torch.equal(full["input_ids"], input_ids):
+                _LOGGER.warning("chat-template не раскладывается по сообщениям — кэш префиксов выключен")
+                with self._cache_lock:
+                    self._prefix_cache = None
+                return full
+
+        with self._cache_lock:
+            if self._prefix_cache is not None:
+                self._prefix_cache.update(new)
+                while len(self._prefix_cache) > _PROMPT_CACHE_MAX:
+                    self._prefix_cache.pop(next(iter(self._prefix_cache)))
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids), **vision}
+
     def _maybe_reload_model(self):
         if self.model is None:
-            _LOGGER.info("⏳ Загружаю Qwen2.5-VL-3B с 4-bit квантизацией…")
-
+            quant = _QUANT_ENV or Settings.load().local_quant_backend
+            _LOGGER.info("⏳ Загружаю Qwen2.5-VL-3B (квантизация: %s)…", quant)
+            self.model = self._load_quantized(quant)
+            self.model.config.use_cache = True
+            if self.processor is None:
+                self._load_processor()
+            # эмбеддинг Qwen2.5-VL дополнен до 151936 строк при len(tokenizer) == 151665:
+            # сжимать его незачем, resize — только если токенов больше, чем строк
+            if self.model.get_input_embeddings().weight.shape[0] < len(self.tokenizer):
+                self.model.resize_token_embeddings(len(self.tokenizer))
+            if TORCH_COMPILE:
+                compile_decode(self.model, self.tokenizer)
+            _LOGGER.info("✅ Qwen2.5-VL-3B загружена (%s).", quant)
+        elif (getattr(self.model, "hf_quantizer", None) is None      # bnb/AWQ размещены device_map
+              and next(self.model.parameters()).device != torch.device(DEVICE)):
+            _LOGGER.info(f"🔄 Перемещаю модель обратно на {DEVICE}")
+            self.model.to(DEVICE)
+
+    def _load_processor(self) -> None:
+        """Процессор/токенизатор не зависят от весов — грузим один раз, выгрузка их не трогает."""
+        self.processor = AutoProcessor.from_pretrained(
+            _MODEL_NAME,
+            min_pixels=_MIN_PIXELS,
+            max_pixels=_MAX_PIXELS,
+        )
+        self.tokenizer = self.processor.tokenizer
+        prepare_processor(self.processor)
+        self._init_template(self.processor)
+        sys_text = self._apply_template(
+            [{"role": "system", "content": [{"type": "text", "text": _SYSTEM_PROMPT}]}],
+            tokenize=False, add_generation_prompt=False,
+        )
+        sys_ids = self.tokenizer(sys_text, return_tensors="pt", add_special_tokens=False).input_ids
+        self._sys_prefix = (sys_text, sys_ids)
+        gen_text = self._apply_template(
+            [{"role": "system", "content": [{"type": "text", "text": _SYSTEM_PROMPT}]}],
+            tokenize=False, add_generation_prompt=True,
+        )[len(sys_text):]
+        self._gen_prompt_ids = self.tokenizer(
+            gen_text, return_tensors="pt", add_special_tokens=False
+        ).input_ids[0]
+
+    @staticmethod
+    def _load_quantized(quant: str) -> Qwen2_5_VLForConditionalGeneration:
+        """AWQ/GPTQ(Marlin) — dequant сливается с GEMM в одном ядре; NF4/INT8 — на лету, bnb."""
+        if quant == "awq":
+            # transformers читает quantization_config из чекпойнта (нужен пакет autoawq)
+            return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+                _QUANT_MODEL_NAMES["awq"],
+                torch_dtype=torch.float16,
+                device_map="auto",
+                attn_implementation=ATTN_IMPL,
+            )
+        if quant == "gptq-marlin":
+            return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+                _QUANT_MODEL_NAMES["gptq-marlin"],
+                quantization_config=GPTQConfig(bits=4, use_exllama=False, backend="marlin"),
+                torch_dtype=torch.float16,
+                device_map="auto",
+                attn_implementation=ATTN_IMPL,
+            )
+        if quant == "none":
+            return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+                _MODEL_NAME,
+                torch_dtype=DTYPE,
+                device_map={"": DEVICE},
+                attn_implementation=ATTN_IMPL,
+            )
+        if quant == "bnb-int8":
+            bnb_config = BitsAndBytesConfig(load_in_8bit=True)
+        else:
             bnb_config = BitsAndBytesConfig(
                 load_in_4bit=True,
                 bnb_4bit_compute_dtype=torch.float16,
                 bnb_4bit_use_double_quant=True,
                 bnb_4bit_quant_type="nf4",
             )
+        return Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            _MODEL_NAME,
+            quantization_config=bnb_config,
+            device_map="auto",
+            attn_implementation=ATTN_IMPL,
+        )
 
-            self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                _MODEL_NAME,
-                quantization_config=bnb_config,
-                device_map="auto"
-            )
-            self.processor = AutoProcessor.from_pretrained(
-                _MODEL_NAME,
-                min_pixels=28 * 28,  # ≈ 1 визуальный токен
-                max_pixels=1280 * 28 * 28,  # как в примере
-            )
-
-            self.tokenizer = self.processor.tokenizer
-            self.model.resize_token_embeddings(len(self.tokenizer))
-            _prepare_processor(self.processor)
-            _LOGGER.info("✅ Qwen2.5-VL-3B загружена (4-bit).")
-        elif next(self.model.parameters()).device != torch.device(_DEVICE):
-            _LOGGER.info(f"🔄 Перемещаю модель обратно на {_DEVICE}")
-            self.model.to(_DEVICE)
+    def _generation_kwargs(self, kw: dict, cancel: threading.Event | None = None) -> dict:
+        """Жадный декодинг с KV-кэшем; max_new_tokens и stop (строка/список) — из **kw.
+
+        *cancel* — флаг, по которому generate прерывается (брошенный stream()).
+        """
+        eos = self.tokenizer.eos_token_id
+        pad = self.tokenizer.pad_token_id
+        gen = dict(
+            max_new_tokens=kw.get("max_new_tokens", _MAX_TOKENS),
+            do_sample=False,
+            num_beams=1,
+            use_cache=True,
+            pad_token_id=eos if pad is None else pad,
+            eos_token_id=eos,
+        )
+        criteria = StoppingCriteriaList()
+        stop = kw.get("stop")
+        if stop:
+            stop = [stop] if isinstance(stop, str) else list(stop)
+            criteria.append(StopStringCriteria(self.tokenizer, stop))
+        if cancel is not None:
+            criteria.append(_StopFlag(cancel))
+        if criteria:
+            gen["stopping_criteria"] = criteria
+        return gen
 
     def unload_model(self):
         if self.model is None:
@@ -179,75 +518,86 @@ class _LocalQwenBackend(ModelBackend):
         mode = Settings.load().local_unload_mode
         if mode == "none":
             return
-        if torch.cuda.is_available():
+        log_vram = _VRAM_LOG and torch.cuda.is_available()
+        if log_vram:
+            torch.cuda.synchronize()
             before = torch.cuda.memory_allocated() / 1024 ** 2
+        if mode == "cpu" and getattr(self.model, "hf_quantizer", None) is not None:
+            # bnb/AWQ/GPTQ-веса .to("cpu") не переносятся — освободить VRAM можно только удалив модель
+            _LOGGER.info("Квантизованную модель в RAM не перенести — выгружаю полностью")
+            mode = "full"
         if mode == "cpu":
             self.model.to("cpu")
         elif mode == "full":
-            del self.model, self.processor, self.tokenizer
-            self.model = self.processor = self.tokenizer = None
-        import gc, torch as t
-        gc.collect()
-        t.cuda.empty_cache()
-        if torch.cuda.is_available():
+            del self.model
+            self.model = None
+        else:
+            return
+        gc.collect()                    # сначала отпускаем ссылки, потом — кэш аллокатора
+        torch.cuda.empty_cache()
+        if log_vram:
+            torch.cuda.synchronize()
             after = torch.cuda.memory_allocated() / 1024 ** 2
             _LOGGER.info(f"🔋 VRAM: {before:.1f} MB → {after:.1f} MB")
 
     # -------------- sync --------------
     def generate(self, messages: List[dict], **kw) -> str:
-        self._maybe_reload_model()
-        messages = propagate_last_image(normalize(messages))
-        # Добавляем system-подсказку:
-        messages.insert(0, {
-            "role": "system",
-            "content": (
-                "Ты — ИИ-ассистент по графическому дизайну. "
-                "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX "
-                "или на эстетике кадра. Отвечай кратко и по существу."
-            )
-        })
-        batch = _build_inputs(self, messages)
-        output = self.model.generate(
-            **batch,
-            max_new_tokens=_MAX_TOKENS,
-            pad_token_id=self.tokenizer.pad_token_id,
-            eos_token_id=self.tokenizer.eos_token_id,
-        )
-        gen_ids = output[0][batch["input_ids"].shape[1]:]
-        self.unload_model()
-        return self.tokenizer.decode(gen_ids, skip_special_tokens=True)
+        # system-подсказка — общий объект, без insert(0) со сдвигом списка
+        messages = [_SYSTEM_MSG, *propagate_last_image(normalize(messages))]
+        images = _decode_images_async(messages)   # декодируем параллельно с загрузкой модели
+        with self._idle.busy():
+            with self._model_lock:
+                self._maybe_reload_model()
+            batch = _build_inputs(self, messages, images)
+            output = generate_no_grad(self.model, **batch, **self._generation_kwargs(kw))
+            gen_ids = output[0][batch["input_ids"].shape[1]:]
+            return self.tokenizer.decode(gen_ids, skip_special_tokens=True)
 
     # -------------- stream --------------
     def stream(self, messages: List[dict], **kw) -> Iterator[str]:
-        self._maybe_reload_model()
-        messages = propagate_last_image(normalize(messages))
-        # Добавляем system-подсказку:
-        messages.insert(0, {
-            "role": "system",
-            "content": (
-                "Ты — ИИ-ассистент по графическому дизайну. "
-                "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX "
-                "или на эстетике кадра. Отвечай кратко и по существу."
+        # system-подсказка — общий объект, без insert(0) со сдвигом списка
+        messages = [_SYSTEM_MSG, *propagate_last_image(normalize(messages))]
+        images = _decode_images_async(messages)   # декодируем параллельно с загрузкой модели
+        with self._idle.busy():
+            with self._model_lock:
+                self._maybe_reload_model()
+            batch = _build_inputs(self, messages, images)
+            streamer = TextIteratorStreamer(
+                self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=_STREAM_TIMEOUT
             )
-        })
-        batch = _build_inputs(self, messages)
-        streamer = TextIteratorStreamer(
-            self.tokenizer, skip_prompt=True, skip_special_tokens=True
-        )
-        threading.Thread(
-            target=self.model.generate,
-            kwargs=dict(
-                **batch,
-                streamer=streamer,
-                max_new_tokens=_MAX_TOKENS,
-                pad_token_id=self.tokenizer.pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-            ),
-            daemon=True,
-        ).start()
-        for tok in streamer:
-            yield tok
-        self.unload_model()
+            # ограниченная очередь: медленный читатель притормаживает генерацию (put с timeout)
+            text_queue = streamer.text_queue = queue.Queue(maxsize=_STREAM_QUEUE_MAX)
+            cancel = threading.Event()
+            future = self._gen_pool.submit(
+                generate_no_grad, self.model, **batch, streamer=streamer,
+                **self._generation_kwargs(kw, cancel),
+            )
+
+            def _end_on_error(f: Future) -> None:
+                # упавший generate не пришлёт stop_signal. streamer.end() тут нельзя:
+                # его put() на полной очереди ждал бы ещё _STREAM_TIMEOUT — ответ всё
+                # равно сорван, поэтому недочитанный текст выбрасываем
+                if f.exception() is None:
+                    return
+                _drain(text_queue)
+                text_queue.put_nowait(streamer.stop_signal)
+
+            future.add_done_callback(_end_on_error)
+            try:
+                yield from coalesce(streamer)
+            except queue.Empty:
+                raise TimeoutError(
+                    f"Локальная модель не отвечает дольше {_STREAM_TIMEOUT:.0f} с"
+                ) from None
+            finally:
+                # брошенный стрим (смена чата, отмена): generate останавливается на
+                # следующем шаге, а его put() не висит на полной очереди — единственный
+                # поток _gen_pool сразу свободен для следующего запроса
+                cancel.set()
+                while not future.done():
+                    _drain(text_queue)
+                    time.sleep(0.01)
+            future.result()                 # исключение из generate — вызывающему, а не в пустоту
 
 
 # Экспортируем для регистратора
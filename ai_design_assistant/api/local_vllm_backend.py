@@ -0,0 +1,214 @@
+# ai_design_assistant/api/local_vllm_backend.py
+"""
+Локальный Qwen2.5-VL через vLLM: PagedAttention, continuous batching,
+prefix caching (KV system-подсказки переиспользуется между запросами)
+и — по желанию — спекулятивный декодинг с маленькой draft-моделью.
+
+Без установленного vllm модуль не импортируется, и бекенд просто
+не регистрируется (как openai без ключа).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import uuid
+from typing import Iterator, List
+
+from transformers import AutoProcessor
+from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
+
+from ai_design_assistant.api.local_qwen25_backend import (
+    _SYSTEM_MSG,
+    _collapse_messages,
+    _decode_images,
+    _gather_images,
+    propagate_last_image,
+)
+from ai_design_assistant.core.models import ModelBackend, normalize
+from ai_design_assistant.core.settings import Settings
+
+_LOGGER = logging.getLogger(__name__)
+
+# ───────────────────────────────────────────
+# модель и лимит картинок — из Settings (vllm_model / vllm_max_images), env VLLM_MODEL_NAME важнее;
+# квантование vLLM определяет сам по quantization_config чекпойнта (AWQ → Marlin-ядра)
+_QUANTIZATION = os.getenv("VLLM_QUANTIZATION") or None
+_DRAFT_MODEL = os.getenv("VLLM_DRAFT_MODEL", "")                     # напр. Qwen/Qwen2.5-0.5B-Instruct
+_NUM_SPEC_TOKENS = int(os.getenv("VLLM_NUM_SPECULATIVE_TOKENS", "5"))
+_GPU_MEMORY = float(os.getenv("VLLM_GPU_MEMORY_UTILIZATION", "0.85"))
+_MAX_TOKENS = int(os.getenv("LOCAL_MAX_NEW_TOKENS", "1024"))
+# ───────────────────────────────────────────
+
+
+def _model_name() -> str:
+    return os.getenv("VLLM_MODEL_NAME") or Settings.load().vllm_model
+
+
+def _engine_args(model: str, max_images: int) -> AsyncEngineArgs:
+    kwargs = dict(
+        model=model,
+        quantization=_QUANTIZATION,
+        enable_prefix_caching=True,
+        gpu_memory_utilization=_GPU_MEMORY,
+        limit_mm_per_prompt={"image": max_images},
+    )
+    if _DRAFT_MODEL:
+        kwargs["speculative_config"] = {
+            "model": _DRAFT_MODEL,
+            "num_speculative_tokens": _NUM_SPEC_TOKENS,
+        }
+    return AsyncEngineArgs(**kwargs)
+
+
+def _has_image(msg: dict) -> bool:
+    content = msg["content"]
+    if isinstance(content, list):
+        return any(chunk["type"] == "image_url" for chunk in content)
+    return bool(msg.get("image"))
+
+
+def _strip_image(msg: dict) -> dict:
+    msg = msg.copy()
+    if isinstance(msg["content"], list):
+        msg["content"] = [chunk for chunk in msg["content"] if chunk["type"] != "image_url"]
+    msg.pop("image", None)
+    return msg
+
+
+def keep_last_images(messages: list[dict], limit: int) -> list[dict]:
+    """Картинки остаются только у последних *limit* сообщений с картинкой.
+
+    vLLM отклоняет запрос, где изображений больше limit_mm_per_prompt, а
+    propagate_last_image() копирует картинку в каждое user-сообщение — длинный
+    диалог с одной картинкой упирался бы в лимит уже на пятой реплике.
+    """
+    out = []
+    for msg in reversed(messages):
+        if _has_image(msg):
+            if limit > 0:
+                limit -= 1
+            else:
+                msg = _strip_image(msg)
+        out.append(msg)
+    out.reverse()
+    return out
+
+
+class _VLLMBackend(ModelBackend):
+    name = "local_vllm"
+
+    def __init__(self) -> None:
+        # движок поднимается лениво, при первом запросе
+        self._engine: AsyncLLMEngine | None = None
+        self._processor = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        self._max_images = 0            # limit_mm_per_prompt поднятого движка
+        self._config: tuple[str, int] | None = None   # (модель, лимит картинок) поднятого движка
+
+    # ---------------- helpers -----------------
+    def _ensure_engine(self) -> None:
+        """Поднять движок при первом запросе.
+
+        vllm_model / vllm_max_images читаются только здесь: движок держит VRAM
+        (веса + KV-кэш) до конца процесса, и на лету его не пересоздаём —
+        новые значения применяются после перезапуска приложения.
+        """
+        with self._lock:
+            if self._engine is not None:
+                self._warn_if_reconfigured()
+                return
+            settings = Settings.load()
+            model = _model_name()
+            max_images = max(1, settings.vllm_max_images)
+            _LOGGER.info("⏳ Запускаю vLLM (%s)…", model)
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="vllm-loop", daemon=True).start()
+
+            async def _create() -> AsyncLLMEngine:
+                return AsyncLLMEngine.from_engine_args(_engine_args(model, max_images))
+
+            self._engine = asyncio.run_coroutine_threadsafe(_create(), loop).result()
+            self._processor = AutoProcessor.from_pretrained(model)
+            self._max_images = max_images
+            self._config = (model, max_images)
+            self._loop = loop
+            _LOGGER.info("✅ vLLM готов.")
+
+    def _warn_if_reconfigured(self) -> None:
+        wanted = (_model_name(), max(1, Settings.load().vllm_max_images))
+        if wanted != self._config:
+            _LOGGER.warning(
+                "Настройки vLLM изменились (%s → %s) — применятся после перезапуска приложения",
+                self._config, wanted,
+            )
+            self._config = wanted       # предупреждаем один раз на изменение
+
+    def _build_request(self, messages: List[dict]) -> dict:
+        messages = [_SYSTEM_MSG, *propagate_last_image(normalize(messages))]
+        messages = keep_last_images(messages, self._max_images)
+        images = _decode_images(_gather_images(messages))
+        hf_msgs, image_inputs, _ = _collapse_messages(messages, images)
+        request = {
+            "prompt": self._processor.apply_chat_template(
+                hf_msgs, tokenize=False, add_generation_prompt=True
+            )
+        }
+        if image_inputs:
+            request["multi_modal_data"] = {"image": image_inputs}
+        return request
+
+    # -------------- sync --------------
+    def generate(self, messages: List[dict], **kw) -> str:
+        return "".join(self.stream(messages, **kw))
+
+    # -------------- stream --------------
+    def stream(self, messages: List[dict], **kw) -> Iterator[str]:
+        self._ensure_engine()
+        request = self._build_request(messages)
+        # как у HF-бекенда: жадный декодинг, max_new_tokens и stop — из **kw
+        stop = kw.get("stop")
+        params = SamplingParams(
+            temperature=0.0,
+            max_tokens=kw.get("max_new_tokens", _MAX_TOKENS),
+            stop=[stop] if isinstance(stop, str) else stop,
+            include_stop_str_in_output=True,    # StopStringCriteria тоже оставляет stop в тексте
+        )
+        out: queue.Queue = queue.Queue()
+        request_id = uuid.uuid4().hex
+
+        async def _pump() -> None:
+            sent = 0
+            try:
+                async for result in self._engine.generate(request, params, request_id):
+                    text = result.outputs[0].text      # накопительный текст → отдаём дельту
+                    if len(text) > sent:
+                        out.put(text[sent:])
+                        sent = len(text)
+            except Exception as exc:                 # noqa: BLE001 — пробрасываем в поток вызывающего
+                out.put(exc)
+            finally:
+                out.put(None)
+
+        pump = asyncio.run_coroutine_threadsafe(_pump(), self._loop)
+        try:
+            while (item := out.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # брошенный стрим (отмена, смена чата): иначе vLLM декодирует до max_tokens,
+            # держа KV-блоки, которые нужны следующим запросам
+            if not pump.done():
+                asyncio.run_coroutine_threadsafe(self._engine.abort(request_id), self._loop)
+
+
+# Экспортируем для регистратора
+backend = _VLLMBackend()
+
+def summarize_chat(prompt: str) -> str:
+    """Суммаризация через vLLM."""
+    return backend.generate([{"role": "user", "content": prompt}])
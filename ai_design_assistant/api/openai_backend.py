@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator, List
 
+import httpx
 import openai
-from packaging import version
 
 from ai_design_assistant.core.models import ModelBackend, normalize
 from ai_design_assistant.core.plugins import get_function_descriptions, call_function_by_name
@@ -16,8 +17,76 @@ if not _API_KEY:
     raise ImportError("OPENAI_API_KEY missing – backend disabled")
 
 
-_VER = version.parse(openai.__version__)
-_IS_NEW = _VER.major >= 1  # True для 1.x, 2.x …
+# проба возможностей вместо разбора версии: клиентский класс есть только в SDK ≥ 1.x
+_IS_NEW = hasattr(openai, "OpenAI")
+
+_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+try:                                    # HTTP/2 требует пакет h2 (httpx[http2])
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# system-сообщения постоянны — общий dict на все запросы (не изменяем его)
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "Ты — ИИ-ассистент по графическому дизайну. "
+        "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX или на эстетике кадра."
+        "Если пользователь просит совета по его фото, будь то интерфейс или обычное фото, старайся проанализировать его и выдать дельный совет."
+    )
+}
+_STREAM_SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "Ты — ИИ-ассистент по графическому дизайну. "
+        "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX или на эстетике кадра."
+    )
+}
+
+if _IS_NEW:
+    # один клиент на процесс: keep-alive + мультиплексирование HTTP/2,
+    # в том числе для follow-up запроса после tool_calls
+    _CLIENT = openai.OpenAI(
+        api_key=_API_KEY,
+        http_client=httpx.Client(http2=_HTTP2, timeout=_TIMEOUT, limits=_LIMITS),
+    )
+
+    def _chat_create(**kw):
+        # ключ мог поменяться через SettingsDialog → читаем при каждом запросе
+        _CLIENT.api_key = os.getenv("OPENAI_API_KEY") or _API_KEY
+        return _CLIENT.chat.completions.create(**kw)
+
+    def _get_delta(delta, field: str):
+        return getattr(delta, field, None)
+else:
+    def _chat_create(**kw):
+        openai.api_key = os.getenv("OPENAI_API_KEY") or _API_KEY
+        return openai.ChatCompletion.create(**kw)
+
+    def _get_delta(delta, field: str):
+        return delta.get(field)
+
+
+# независимые tool_calls одного ответа выполняем параллельно (PIL/torch отпускают GIL)
+_TOOL_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="openai-tool")
+
+
+def _run_tool(name: str, args: dict) -> str:
+    try:
+        return call_function_by_name(name, **args)
+    except Exception as e:
+        return f"❌ Ошибка выполнения функции `{name}`: {e}"
+
+
+def _run_tools(calls: list[tuple[str, dict]]) -> list[str]:
+    """Выполнить [(name, args), …]; результаты — в исходном порядке."""
+    if len(calls) <= 1:
+        return [_run_tool(name, args) for name, args in calls]
+    return list(_TOOL_POOL.map(_run_tool, *zip(*calls)))
+
 
 # ---------------------------------------------------------------------
 class _OpenAIBackend(ModelBackend):
@@ -25,211 +94,168 @@ class _OpenAIBackend(ModelBackend):
 
     # ── one-shot ──────────────────────────────────────────────────────
     def generate(self, messages: List, **kw) -> str:
-        msgs = normalize(messages)
-
-        msgs.insert(0, {
-            "role": "system",
-            "content": (
-                "Ты — ИИ-ассистент по графическому дизайну. "
-                "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX или на эстетике кадра."
-                "Если пользователь просит совета по его фото, будь то интерфейс или обычное фото, старайся проанализировать его и выдать дельный совет."
-            )
-        })
+        msgs = [_SYSTEM_MSG, *normalize(messages)]
 
         tools = get_function_descriptions()
 
-        if _IS_NEW:
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=msgs,
-                tools=tools,
-                tool_choice="auto",
-                **kw
+        response = _chat_create(
+            model="gpt-4o",
+            messages=msgs,
+            tools=tools,
+            tool_choice="auto",
+            **kw
+        )
+        msg = response.choices[0].message
+
+        if getattr(msg, "tool_calls", None):   # старый SDK: поля может не быть
+            calls, call_ids = [], []
+            # подставим последнее изображение — ищем один раз на все tool_calls
+            last_image = next(
+                (m.get("image") for m in reversed(msgs) if m.get("role") == "user" and m.get("image")),
+                None
             )
-            msg = response.choices[0].message
-
-            if msg.tool_calls:
-                tool_messages = []
-
-                for tool_call in msg.tool_calls:
-                    name = getattr(getattr(tool_call, "function", None), "name", None)
-                    if not name:
-                        continue
-
-                    try:
-                        args = json.loads(getattr(tool_call.function, "arguments", "") or "{}")
-                        if isinstance(args, str):
-                            args = {"image_path": args, "quality": 60}
-                        elif not isinstance(args, dict):
-                            args = {}
-                    except Exception:
-                        args = {}
-
-                    args.pop("name", None)
 
-                    # подставим последнее изображение
-                    last_image = next(
-                        (m.get("image") for m in reversed(msgs) if m.get("role") == "user" and m.get("image")),
-                        None
-                    )
+            for tool_call in msg.tool_calls:
+                name = getattr(getattr(tool_call, "function", None), "name", None)
+                if not name:
+                    continue
 
-                    if "image_path" not in args and last_image:
-                        args["image_path"] = last_image
-
-                    try:
-                        result = call_function_by_name(name, **args)
-                    except Exception as e:
-                        result = f"❌ Ошибка выполнения функции `{name}`: {e}"
+                try:
+                    args = json.loads(getattr(tool_call.function, "arguments", "") or "{}")
+                    if isinstance(args, str):
+                        args = {"image_path": args, "quality": 60}
+                    elif not isinstance(args, dict):
+                        args = {}
+                except Exception:
+                    args = {}
 
-                    tool_messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": result
-                    })
+                args.pop("name", None)
 
-                msgs.append(msg)
-                msgs.extend(tool_messages)
+                if "image_path" not in args and last_image:
+                    args["image_path"] = last_image
 
-                followup = openai.chat.completions.create(
-                    model="gpt-4o",
-                    messages=msgs,
-                    **kw
-                )
-                return followup.choices[0].message.content or "✓"
+                calls.append((name, args))
+                call_ids.append(tool_call.id)
 
-            return msg.content or "✓"
+            msgs.append(msg)
+            msgs.extend(
+                {"role": "tool", "tool_call_id": call_id, "content": result}
+                for call_id, result in zip(call_ids, _run_tools(calls))
+            )
 
-        else:
-            response = openai.ChatCompletion.create(
+            followup = _chat_create(
                 model="gpt-4o",
                 messages=msgs,
-                tools=tools,
-                tool_choice="auto",
                 **kw
             )
-            return response.choices[0].message.content or "✓"
+            return followup.choices[0].message.content or "✓"
+
+        return msg.content or "✓"
 
     # ── streaming (yield tokens) ─────────────────────────────────────
     def stream(self, messages: List, **kw) -> Iterator[str]:
-        msgs = normalize(messages)
-
-        msgs.insert(0, {
-            "role": "system",
-            "content": (
-                "Ты — ИИ-ассистент по графическому дизайну. "
-                "Если получаешь изображение с людьми, игнорируй лица и сосредоточься на UI/UX или на эстетике кадра."
-            )
-        })
+        msgs = [_STREAM_SYSTEM_MSG, *normalize(messages)]
 
         tools = get_function_descriptions()
         tool_calls_raw = []
-        full_text = ""
 
-        if _IS_NEW:
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=msgs,
-                tools=tools,
-                tool_choice="auto",
-                stream=True,
-                **kw
+        response = _chat_create(
+            model="gpt-4o",
+            messages=msgs,
+            tools=tools,
+            tool_choice="auto",
+            stream=True,
+            **kw
+        )
+
+        get_delta = _get_delta
+        for chunk in response:
+            delta = chunk.choices[0].delta
+            if tool_calls := get_delta(delta, "tool_calls"):
+                tool_calls_raw.extend(tool_calls)
+            elif content := get_delta(delta, "content"):
+                yield content
+
+        if tool_calls_raw:
+            yield "\n[⚙️ Выполняю инструмент...]\n"
+            valid_tool_calls = [
+                tc for tc in tool_calls_raw
+                if getattr(tc, "id", None) and getattr(getattr(tc, "function", None), "name", None)
+            ]
+
+            if not valid_tool_calls:
+                yield "\n❌ Ошибка: не найдено ни одного валидного tool_call\n"
+                return
+
+            msgs.append({
+                "role": "assistant",
+                "tool_calls": valid_tool_calls
+            })
+
+            # сначала разбираем аргументы, потом выполняем всё пачкой;
+            # None в tool_slots — место под результат, сохраняющее порядок
+            tool_slots: list[dict | None] = []
+            calls, call_ids = [], []
+            last_image = next(
+                (m.get("image") for m in reversed(msgs) if m.get("role") == "user" and m.get("image")),
+                None
             )
+            for tool_call in valid_tool_calls:
+                name = getattr(getattr(tool_call, "function", None), "name", None)
+                tool_call_id = getattr(tool_call, "id", None)
+
+                if not name or not tool_call_id:
+                    yield "\n❌ Ошибка: tool_call без имени или без id\n"
+                    continue
+
+                arguments = getattr(tool_call.function, "arguments", None)
+                if not arguments or arguments in ("", "null"):
+                    arguments = "{}"
+
+                try:
+                    args = json.loads(arguments)
+                    if isinstance(args, str):
+                        args = {"image_path": args, "quality": 60}
+                    elif not isinstance(args, dict):
+                        raise TypeError(f"Неверный тип аргументов: {type(args)} — {args!r}")
+                except Exception as e:
+                    error_msg = f"❌ Ошибка разбора аргументов: {e}"
+                    yield f"\n{error_msg}\n"
+                    tool_slots.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call_id,
+                        "content": error_msg
+                    })
+                    continue
+
+                if "image_path" not in args and last_image:
+                    args["image_path"] = last_image
 
-            for chunk in response:
-                delta = chunk.choices[0].delta
-                if hasattr(delta, "tool_calls") and delta.tool_calls:
-                    tool_calls_raw.extend(delta.tool_calls)
-                elif hasattr(delta, "content") and delta.content:
-                    full_text += delta.content
-                    yield delta.content
-
-            if tool_calls_raw:
-                yield "\n[⚙️ Выполняю инструмент...]\n"
-                valid_tool_calls = [
-                    tc for tc in tool_calls_raw
-                    if getattr(tc, "id", None) and getattr(getattr(tc, "function", None), "name", None)
-                ]
-
-                if not valid_tool_calls:
-                    yield "\n❌ Ошибка: не найдено ни одного валидного tool_call\n"
-                    return
-
-                msgs.append({
-                    "role": "assistant",
-                    "tool_calls": valid_tool_calls
-                })
-
-                for tool_call in valid_tool_calls:
-                    name = getattr(getattr(tool_call, "function", None), "name", None)
-                    tool_call_id = getattr(tool_call, "id", None)
-
-                    if not name or not tool_call_id:
-                        yield "\n❌ Ошибка: tool_call без имени или без id\n"
-                        continue
-
-                    arguments = getattr(tool_call.function, "arguments", None)
-                    if not arguments or arguments in ("", "null"):
-                        arguments = "{}"
-
-                    try:
-                        args = json.loads(arguments)
-                        if isinstance(args, str):
-                            args = {"image_path": args, "quality": 60}
-                        elif not isinstance(args, dict):
-                            raise TypeError(f"Неверный тип аргументов: {type(args)} — {args!r}")
-                    except Exception as e:
-                        error_msg = f"❌ Ошибка разбора аргументов: {e}"
-                        yield f"\n{error_msg}\n"
-                        msgs.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call_id,
-                            "content": error_msg
-                        })
-                        continue
-
-                    last_image = next(
-                        (m.get("image") for m in reversed(msgs) if m.get("role") == "user" and m.get("image")),
-                        None
-                    )
-
-                    if "image_path" not in args and last_image:
-                        args["image_path"] = last_image
-
-                    args.pop("name", None)
-
-                    try:
-                        result = call_function_by_name(name, **args)
-                    except Exception as e:
-                        result = f"❌ Ошибка выполнения функции `{name}`: {e}"
-
-                    msgs.append({
+                args.pop("name", None)
+
+                tool_slots.append(None)
+                calls.append((name, args))
+                call_ids.append(tool_call_id)
+
+            results = iter(zip(call_ids, _run_tools(calls)))
+            for slot in tool_slots:
+                if slot is None:
+                    tool_call_id, result = next(results)
+                    slot = {
                         "role": "tool",
                         "tool_call_id": tool_call_id,
                         "content": result or "Готово"
-                    })
+                    }
+                msgs.append(slot)
 
-                followup = openai.chat.completions.create(
-                    model="gpt-4o",
-                    messages=msgs,
-                    **kw
-                )
-                final = followup.choices[0].message.content
-                if final:
-                    yield "\n" + final
-
-        else:
-            response = openai.ChatCompletion.create(
+            followup = _chat_create(
                 model="gpt-4o",
                 messages=msgs,
-                tools=tools,
-                tool_choice="auto",
-                stream=True,
                 **kw
             )
-            for chunk in response:
-                delta = chunk.choices[0].delta
-                if "content" in delta:
-                    yield delta["content"]
+            final = followup.choices[0].message.content
+            if final:
+                yield "\n" + final
 
 
 backend = _OpenAIBackend()
@@ -18,15 +18,11 @@ __all__ = [
 # ──────────────────────────────────────────────
 #  ЛЕНИВАЯ фабрика глобального роутера LLM
 # ──────────────────────────────────────────────
-from typing import Optional
-
-_GLOBAL_ROUTER: Optional["LLMRouter"] = None
+import functools
 
 
+@functools.cache
 def get_global_router():              # noqa: D401
     """Singleton-роутер, создаётся при первом обращении."""
-    global _GLOBAL_ROUTER
-    if _GLOBAL_ROUTER is None:
-        from .models import LLMRouter  # импорт здесь ↷ нет циклов
-        _GLOBAL_ROUTER = LLMRouter()
-    return _GLOBAL_ROUTER
+    from .models import LLMRouter  # импорт здесь ↷ нет циклов
+    return LLMRouter()
@@ -1,23 +1,64 @@
 from __future__ import annotations
+import contextlib
+import io
 import json
+import os
+import re
+import sys
 import uuid
 import logging
-from dataclasses import dataclass, field, asdict
-from datetime import datetime, timezone
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields, replace
 from pathlib import Path
-from typing import Final, Literal, Optional, Iterable
+from shutil import copyfile
+import tempfile
+import time
+from typing import ClassVar, Final, Literal, Optional, Iterable, Iterator
 
+try:                                    # orjson: сразу UTF-8 bytes, без str → bytes перекодирования
+    import orjson
 
-import tempfile
+    def _dumps(obj, pretty: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, option=option)
+
+    def _dumps_line(obj) -> bytes:
+        # Message (frozen dataclass) orjson сериализует сам, на стороне C — без промежуточного dict
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    _loads = orjson.loads
+    _LOADS_BUFFER = True                # orjson парсит прямо из memoryview (mmap) — без копии в bytes
+except ImportError:                     # orjson необязателен
+    def _dumps(obj, pretty: bool = False) -> bytes:
+        if pretty:
+            return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _dumps_line(obj) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), default=_message_to_dict
+        ).encode("utf-8")
+
+    _loads = json.loads
+    _LOADS_BUFFER = False               # json.loads принимает только str/bytes/bytearray
 
 from ai_design_assistant.core.settings import get_chats_directory, Settings
 from ai_design_assistant.core.summarizers import textrank_title
 
 logger = logging.getLogger(__name__)
 
-_APP_NAME: Final = "AI Design Assistant"
 _DEFAULT_TITLE: Final = "Untitled chat"
 _CHAT_SCHEMA_VERSION: Final = 1
+# JSON Lines: строка 0 — заголовок (title/uuid/schema_version), дальше по строке на сообщение;
+# старые чаты в одном .json читаются и при первой записи переписываются в .jsonl
+_CHAT_SUFFIX: Final = ".jsonl"
+_LEGACY_SUFFIX: Final = ".json"
+_CHAT_DIR_RE: Final = re.compile(r"^chat_(\d+)$")   # папки chat_N в корне чатов
+_IMAGES_DIR: Final = Path("images")   # вложения чата, см. add_image_message()
+_MMAP_LOAD_MIN: Final = 256 << 10  # крупнее — старый .json парсится из mmap, а не из read_bytes()
+_STREAM_LOAD_MIN: Final = 1 << 20  # крупнее — load() читает .jsonl построчно
+_WRITE_BUFFER: Final = io.DEFAULT_BUFFER_SIZE * 64  # 512 KiB буфер для полной перезаписи
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -29,9 +70,50 @@ class Message:
     role: Literal["user", "assistant", "system"]
     content: str
     image: Optional[str] = None  # относительный путь
-    timestamp: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    # тот же ISO-8601 (UTC, до секунд), что давал datetime.isoformat, но без объектов datetime/tzinfo
+    timestamp: str = field(default_factory=lambda: time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()))
     uuid: str = field(default_factory=lambda: uuid.uuid4().hex)
 
+    def __post_init__(self) -> None:
+        # роль — одна из трёх строк: интернируем, чтобы тысячи сообщений делили один объект
+        object.__setattr__(self, "role", sys.intern(self.role))
+
+    @classmethod
+    def from_trusted_dict(cls, d: dict) -> Message:
+        """Быстрая сборка из записи нашего же файла — мимо __init__/__post_init__ и default_factory.
+
+        Поля пишутся прямо через slot-дескрипторы; неполная или чужая запись
+        (старый формат) идёт через обычный конструктор.
+        """
+        if len(d) != len(_MESSAGE_SETTERS):
+            return cls(**d)
+        set_role, set_content, set_image, set_timestamp, set_uuid = _MESSAGE_SETTERS
+        m = object.__new__(cls)
+        try:
+            set_role(m, sys.intern(d["role"]))
+            set_content(m, d["content"])
+            set_image(m, d["image"])
+            set_timestamp(m, d["timestamp"])
+            set_uuid(m, d["uuid"])
+        except KeyError:
+            return cls(**d)
+        return m
+
+
+# __set__ slot-дескрипторов Message в порядке полей: обходят frozen-__setattr__ (см. from_trusted_dict)
+_MESSAGE_SETTERS: Final = tuple(Message.__dict__[f.name].__set__ for f in fields(Message))
+
+
+def _message_to_dict(m: Message) -> dict:
+    # литерал вместо asdict(): без рекурсивного обхода полей и deepcopy
+    return {
+        "role": m.role,
+        "content": m.content,
+        "image": m.image,
+        "timestamp": m.timestamp,
+        "uuid": m.uuid,
+    }
+
 
 @dataclass
 class ChatSession:
@@ -41,13 +123,21 @@ class ChatSession:
     schema_version: int = _CHAT_SCHEMA_VERSION
 
     _path: Path | None = field(default=None, init=False, repr=False, compare=False)
+    # внутри batched_saves() сообщения копятся здесь и пишутся одним заходом на выходе
+    _pending: list[Message] = field(default_factory=list, init=False, repr=False, compare=False)
+    _batch_depth: int = field(default=0, init=False, repr=False, compare=False)
+
+    # (папка чатов, следующий номер chat_N) — см. _generate_filename()
+    _next_chat_num: ClassVar[tuple[Path, int] | None] = None
+    # папка чатов, уже подготовленная _chats_root() (mkdir делаем один раз на путь)
+    _ready_root: ClassVar[Path | None] = None
 
     # ──────────────── Message operations ────────────────
 
     def add_message(self, role: str, content: str) -> Message:
         msg = Message(role=role, content=content)
         self.messages.append(msg)
-        self.save()
+        self._append(msg)
 
         # ➜ если это вторая реплика пользователя – пробуем придумать заголовок
         if role == "user" and sum(m.role == "user" for m in self.messages) == 2:
@@ -59,19 +149,19 @@ class ChatSession:
         return msg
 
     def add_image_message(self, role: str, content: str, image_path: str) -> Message:
-        from shutil import copy2
-
         assert self._path is not None, "Chat path not initialized"
 
         # 1. Создаём папку `images/`, если нет
-        images_dir = self._path.parent / "images"
+        images_dir = self._path.parent / _IMAGES_DIR
         images_dir.mkdir(parents=True, exist_ok=True)
 
         # 2. Генерируем имя и копируем изображение
         ext = Path(image_path).suffix or ".png"
         image_name = f"image_{len(self.messages) + 1}{ext}"
         new_path = images_dir / image_name
-        copy2(image_path, new_path)
+        # copyfile: в ядре (sendfile/copy_file_range, fcopyfile на macOS) и без copystat —
+        # время и права исходника вложению не нужны
+        copyfile(image_path, new_path)
 
         # 3. Относительный путь внутри чата
         relative_path = Path("images") / image_name
@@ -82,7 +172,7 @@ class ChatSession:
             image=str(relative_path)  # например: "images/image_3.png"
         )
         self.messages.append(msg)
-        self.save()
+        self._append(msg)
         return msg
 
     def __iter__(self) -> Iterable[Message]:
@@ -97,8 +187,8 @@ class ChatSession:
         chat_dir = chats_dir / session.uuid
         chat_dir.mkdir(parents=True, exist_ok=True)
 
-        # Путь к JSON-файлу внутри chat_N/chat_N.json
-        session._path = chat_dir / f"{session.uuid}.json"
+        # Путь к файлу чата внутри <uuid>/<uuid>.jsonl
+        session._path = chat_dir / f"{session.uuid}{_CHAT_SUFFIX}"
         return session
 
     # ──────────────── File ops ────────────────
@@ -108,7 +198,7 @@ class ChatSession:
             "title": self.title,
             "uuid": self.uuid,
             "schema_version": self.schema_version,
-            "messages": [asdict(m) for m in self.messages],
+            "messages": [_message_to_dict(m) for m in self.messages],
         }
 
     @classmethod
@@ -119,29 +209,80 @@ class ChatSession:
 
         return cls(
             title=data.get("title", _DEFAULT_TITLE),
-            uuid=data.get("uuid", uuid.uuid4().hex),
-            messages=[Message(**m) for m in data.get("messages", [])],
+            uuid=data.get("uuid") or uuid.uuid4().hex,  # uuid4 — только если в файле его нет
+            messages=list(map(Message.from_trusted_dict, data.get("messages", ()))),
             schema_version=_CHAT_SCHEMA_VERSION
         )
 
+    def _header(self) -> dict:
+        return {"title": self.title, "uuid": self.uuid, "schema_version": self.schema_version}
+
+    def _append(self, msg: Message) -> None:
+        """Дописать сообщение строкой в конец .jsonl — O(1) вместо перезаписи всего чата."""
+        if self._batch_depth:
+            self._pending.append(msg)
+            return
+        self._write_lines([msg])
+
+    def _write_lines(self, msgs: list[Message]) -> None:
+        if self._path is None or self._path.suffix != _CHAT_SUFFIX or not self._path.exists():
+            self.save()                 # новый файл или миграция старого .json — полная запись
+            return
+        with self._path.open("ab") as f:
+            f.write(b"".join(_dumps_line(m) + b"\n" for m in msgs))
+
+    @contextlib.contextmanager
+    def batched_saves(self):
+        """Отложить запись новых сообщений до выхода из блока (один open/write на пачку).
+
+        Без таймеров: чат читают и другие потоки (GenerateThread), так что
+        на диск всё попадает сразу по выходу, в исходном порядке.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def flush(self) -> None:
+        """Записать сообщения, отложенные batched_saves()."""
+        pending, self._pending = self._pending, []
+        if pending:
+            self._write_lines(pending)
+
+    close = flush
+
     def save(self) -> Path:
-        if self._path is None or not self._path.name.endswith(".json"):
+        """Полная перезапись чата (новый файл, смена заголовка, правка истории)."""
+        legacy: Path | None = None
+        if self._path is not None and self._path.suffix == _LEGACY_SUFFIX:
+            legacy, self._path = self._path, self._path.with_suffix(_CHAT_SUFFIX)
+        elif self._path is None or self._path.suffix != _CHAT_SUFFIX:
             logger.warning(f"Генерируется путь, старый _path: {self._path}")
             self._path = self._generate_filename()
 
+        self._pending.clear()           # полная запись включает и отложенные сообщения
         try:
             logger.debug(f"Сохраняю чат в: {self._path}")
             self._path.parent.mkdir(parents=True, exist_ok=True)
+            logger.debug(f"Сообщений в чате: {len(self.messages)}")
 
-            payload = self.to_dict()
-            logger.debug(f"Сообщений в чате: {len(payload['messages'])}")
-
-            # Безопасная атомарная перезапись через временный файл
-            with tempfile.NamedTemporaryFile("w", dir=self._path.parent, delete=False, encoding="utf-8") as tmp:
-                json.dump(payload, tmp, ensure_ascii=False, indent=2)
-                tmp_path = Path(tmp.name)
-
-            tmp_path.replace(self._path)
+            lines = [_dumps_line(self._header()), *map(_dumps_line, self.messages)]
+            if not self._path.exists() or len(self.messages) <= 1:
+                # нечего терять: новый файл или ≤ 1 сообщения — пишем напрямую, без temp+rename
+                self._path.write_bytes(b"\n".join(lines) + b"\n")
+            else:
+                # Безопасная атомарная перезапись через временный файл
+                with tempfile.NamedTemporaryFile(
+                    "wb", dir=self._path.parent, delete=False, buffering=_WRITE_BUFFER
+                ) as tmp:
+                    tmp.write(b"\n".join(lines) + b"\n")
+                    tmp_path = Path(tmp.name)
+                tmp_path.replace(self._path)
+            if legacy is not None:
+                legacy.unlink(missing_ok=True)
 
             logger.info(f"Чат успешно сохранён: {self._path}")
             return self._path
@@ -150,45 +291,90 @@ class ChatSession:
             logger.exception(f"Ошибка при сохранении чата: {e}")
             raise
 
+    save_full = save
+
     @classmethod
     def load(cls, path: str | Path) -> ChatSession:
-        p = Path(path).expanduser().resolve()
+        p = Path(path).expanduser().absolute()   # без resolve(): симлинки раскрывать незачем
         if p.is_dir():
             raise ValueError(f"Нельзя загрузить чат: путь {p} — это папка, а не JSON-файл.")
-        data = json.loads(p.read_text("utf-8"))
-        session = cls.from_dict(data)
+        if p.suffix == _CHAT_SUFFIX:
+            torn: list[int] = []
+            with p.open("rb") as f:
+                # мелкий чат — одним read(); крупный — построчно с диска: в памяти
+                # одновременно одна строка-сообщение, а не весь файл целиком
+                small = os.fstat(f.fileno()).st_size <= _STREAM_LOAD_MIN
+                lines = io.BytesIO(f.read()) if small else f
+                header = next(lines, b"")
+                data = _loads(header) if header.strip() else {}
+                data["messages"] = _jsonl_records(lines, len(header), torn)
+                session = cls.from_dict(data)   # Message собираются по мере чтения
+            if torn:
+                # иначе следующая дозапись приклеится к обрывку и испортит уже целую строку
+                logger.warning("Чат %s: последняя строка оборвана при записи — отбрасываю", p)
+                try:
+                    os.truncate(p, torn[0])
+                except OSError as e:
+                    logger.warning("Не удалось обрезать %s: %s", p, e)
+        else:                           # старый формат: один JSON-объект
+            session = cls.from_dict(_load_json_file(p))
         session._path = p
-
-        for msg in session.messages:
-            if msg.image:
-                img_path = (p.parent / msg.image).resolve()
-                if not img_path.exists():
-                    logger.warning(f"Image missing: {img_path}")
-                    msg.image = None
+        session._drop_missing_images()
         return session
 
+    def _drop_missing_images(self) -> None:
+        """Убрать ссылки на пропавшие картинки: один scandir по images/ вместо stat на каждую."""
+        chat_dir = self._path.parent
+        present: set[str] | None = None
+        for i, msg in enumerate(self.messages):
+            if not msg.image:
+                continue
+            img = Path(msg.image)
+            if img.parent == _IMAGES_DIR:
+                if present is None:
+                    try:
+                        with os.scandir(chat_dir / _IMAGES_DIR) as it:
+                            present = {e.name for e in it if e.is_file()}
+                    except FileNotFoundError:
+                        present = set()
+                found = img.name in present
+            else:                       # абсолютный/нестандартный путь — проверяем как раньше
+                found = (chat_dir / img).exists()
+            if not found:
+                logger.warning(f"Image missing: {chat_dir / img}")
+                self.messages[i] = replace(msg, image=None)   # Message неизменяем
+
     @classmethod
     def load_all(cls) -> list[ChatSession]:
         root = cls._chats_root()
-        sessions = []
-        for folder in sorted(root.iterdir()):
-            if folder.is_dir():
-                json_file = folder / f"{folder.name}.json"
-                if json_file.exists():
-                    try:
-                        sessions.append(cls.load(json_file))
-                    except Exception as e:
-                        logger.warning("Ошибка загрузки чата %s: %s", json_file, e)
-        return sessions
+        json_files = [
+            f for folder in sorted(root.iterdir())
+            if folder.is_dir() and (f := cls._chat_file(folder)) is not None
+        ]
+
+        def _load(json_file: Path) -> ChatSession | None:
+            try:
+                return cls.load(json_file)
+            except Exception as e:
+                logger.warning("Ошибка загрузки чата %s: %s", json_file, e)
+                return None
+
+        if len(json_files) <= 1:
+            loaded = map(_load, json_files)
+        else:
+            # чтение файлов и разбор (orjson отпускает GIL) перекрываются; порядок — как у папок
+            with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as ex:
+                loaded = list(ex.map(_load, json_files))
+        return [s for s in loaded if s is not None]
 
     @classmethod
     def purge_old(cls, days: int = 30) -> None:
-        cutoff = datetime.now().timestamp() - days * 86400
+        cutoff = time.time() - days * 86400
         root = cls._chats_root()
         for chat_dir in root.glob("chat_*"):
             if chat_dir.is_dir():
-                json_file = chat_dir / f"{chat_dir.name}.json"
-                if json_file.exists() and json_file.stat().st_mtime < cutoff:
+                json_file = cls._chat_file(chat_dir)
+                if json_file is not None and json_file.stat().st_mtime < cutoff:
                     try:
                         for file in chat_dir.iterdir():
                             file.unlink()
@@ -196,9 +382,20 @@ class ChatSession:
                     except Exception as e:
                         logger.error(f"Failed to delete {chat_dir}: {e}")
 
+    @staticmethod
+    def _chat_file(folder: Path) -> Path | None:
+        """Файл чата в папке: .jsonl, иначе старый .json."""
+        for suffix in (_CHAT_SUFFIX, _LEGACY_SUFFIX):
+            candidate = folder / f"{folder.name}{suffix}"
+            if candidate.exists():
+                return candidate
+        return None
+
     @classmethod
     def _chats_root(cls) -> Path:
         root = get_chats_directory()
+        if root == cls._ready_root:     # уже проверен и создан в этом процессе — без лишних syscall
+            return root
 
         # Если по пути внезапно файл – переименуем и создадим папку
         if root.exists() and root.is_file():
@@ -206,16 +403,28 @@ class ChatSession:
             root.rename(backup)
             logger.warning(f"Файл {root} переименован в {backup}; создаю папку.")
         root.mkdir(parents=True, exist_ok=True)
+        cls._ready_root = root
         return root
 
+    @staticmethod
+    def _scan_max_chat_num(root: Path) -> int:
+        """Максимальный N среди chat_N в *root* — один проход scandir без лишних stat."""
+        match = _CHAT_DIR_RE.match
+        with os.scandir(root) as it:
+            return max((int(m.group(1)) for e in it if (m := match(e.name))), default=0)
+
     @classmethod
     def _generate_filename(cls) -> Path:
         root = cls._chats_root()
-        next_num = 1
+        # следующий свободный номер помним между вызовами (папку чатов могли сменить в настройках)
+        if cls._next_chat_num is None or cls._next_chat_num[0] != root:
+            cls._next_chat_num = (root, cls._scan_max_chat_num(root) + 1)
+        next_num = cls._next_chat_num[1]
+        rescanned = False
 
         while True:
             chat_dir = root / f"chat_{next_num}"
-            json_path = chat_dir / f"chat_{next_num}.json"
+            json_path = chat_dir / f"chat_{next_num}{_CHAT_SUFFIX}"
 
             # 🛡 если по пути chat_dir — файл, а не папка → удалим
             if chat_dir.exists() and not chat_dir.is_dir():
@@ -230,8 +439,17 @@ class ChatSession:
             try:
                 chat_dir.mkdir(parents=True, exist_ok=False)
                 logger.info(f"Создана директория чата: {chat_dir}")
+                cls._next_chat_num = (root, next_num + 1)
                 return json_path
-            except (FileExistsError, PermissionError) as e:
+            except FileExistsError as e:
+                # папку создали в обход кэша — один раз пересканируем каталог
+                logger.warning(f"Проблема с {chat_dir}: {e}")
+                if rescanned:
+                    next_num += 1
+                else:
+                    rescanned = True
+                    next_num = max(next_num + 1, cls._scan_max_chat_num(root) + 1)
+            except PermissionError as e:
                 logger.warning(f"Проблема с {chat_dir}: {e}")
                 next_num += 1
 
@@ -295,29 +513,64 @@ def handle_tool_calls(tool_calls: list[dict], chat: ChatSession) -> list[Message
     from ai_design_assistant.core.plugins import get_plugin_by_name
 
     results = []
-    for call in tool_calls:
-        try:
-            name = call["function"]["name"]
-            args = json.loads(call["function"]["arguments"])
+    with chat.batched_saves():          # K результатов — одна запись на диск
+        for call in tool_calls:
+            try:
+                name = call["function"]["name"]
+                args = json.loads(call["function"]["arguments"])
 
-            plugin = get_plugin_by_name(name)
-            if plugin is None:
-                logger.warning(f"Плагин не найден: {name}")
-                continue
+                plugin = get_plugin_by_name(name)
+                if plugin is None:
+                    logger.warning(f"Плагин не найден: {name}")
+                    continue
 
-            result_path = plugin.run(**args)
+                result_path = plugin.run(**args)
 
-            # Добавляем результат как сообщение ассистента
-            msg = chat.add_image_message("assistant", f"[{plugin.display_name}] Готово!", result_path)
-            results.append(msg)
-        except Exception as e:
-            logger.exception(f"Ошибка при выполнении tool_call: {e}")
-            msg = chat.add_message("assistant", f"❌ Ошибка при вызове плагина: {e}")
-            results.append(msg)
+                # Добавляем результат как сообщение ассистента
+                msg = chat.add_image_message("assistant", f"[{plugin.display_name}] Готово!", result_path)
+                results.append(msg)
+            except Exception as e:
+                logger.exception(f"Ошибка при выполнении tool_call: {e}")
+                msg = chat.add_message("assistant", f"❌ Ошибка при вызове плагина: {e}")
+                results.append(msg)
     return results
 
-def atomic_write_json(path: Path, data: dict) -> None:
-    with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False, encoding="utf-8") as tmp:
-        json.dump(data, tmp, ensure_ascii=False, indent=2)
+def _jsonl_records(lines: Iterable[bytes], offset: int, torn: list[int]) -> Iterator[dict]:
+    """Записи .jsonl по строке; *offset* — байтовая позиция первой из *lines*.
+
+    Недекодируемая последняя строка — оборванная дозапись (_append): она
+    пропускается, а в *torn* кладётся её смещение. Битая строка в середине —
+    настоящая порча файла, исключение уходит вызывающему.
+    """
+    pending, start = None, offset
+    for line in lines:
+        if line.strip():
+            if pending is not None:
+                yield _loads(pending)
+            pending, start = line, offset
+        offset += len(line)
+    if pending is None:
+        return
+    try:
+        record = _loads(pending)
+    except ValueError:                  # orjson.JSONDecodeError и json.JSONDecodeError — оба ValueError
+        torn.append(start)
+        return
+    yield record
+
+
+def _load_json_file(path: Path) -> dict:
+    """Прочитать JSON-файл; крупный — через mmap, без копии всего файла в куче Python."""
+    with path.open("rb") as f:
+        if not _LOADS_BUFFER or os.fstat(f.fileno()).st_size <= _MMAP_LOAD_MIN:
+            return _loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return _loads(view)
+
+
+def atomic_write_json(path: Path, data: dict, *, debug_pretty: bool = False) -> None:
+    """Атомарно записать *data*; по умолчанию компактно, ``debug_pretty`` — с отступами для чтения глазами."""
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, delete=False) as tmp:
+        tmp.write(_dumps(data, debug_pretty))
         temp_path = Path(tmp.name)
     temp_path.replace(path)
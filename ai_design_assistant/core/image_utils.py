@@ -7,27 +7,85 @@ Dependencies (add to requirements.txt):
     rembg>=2.0  # offline background removal
     realesrgan-ncnn-vulkan  # optional CLI for high‑quality upscaling
 
-If *realesrgan-ncnn-vulkan* is unavailable, PIL resize fallback is used.
+If *realesrgan-ncnn-vulkan* is unavailable, PIL resize fallback is used
+(or libvips via ``RESIZE_BACKEND=vips`` when *pyvips* is installed).
 """
 
+import functools
+import hashlib
+import mimetypes
+import os
 import subprocess
+import tempfile
+from io import BytesIO
 from pathlib import Path
-import base64
+from binascii import b2a_base64
 from PIL import Image
-from rembg import remove  # type: ignore
 
 from ai_design_assistant.core.logger import get_logger
 
 log = get_logger("modules")
 
+_B64_BLOCK = 48 * 1024          # кратно 3: блоки кодируются без padding посередине; влезает в L2
+# длинная сторона картинки, уходящей в модель: больше gpt-4o всё равно ужмёт (тайлы 512 px),
+# а локальные VLM платят визуальными токенами за каждый лишний патч
+_MAX_SEND_SIDE = int(os.getenv("MAX_IMAGE_SIDE", "1568"))
+# модель rembg: u2net — его умолчание; u2netp — в разы легче и быстрее, чуть грубее края
+_REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")
+_ERR_TAIL = 2048                # сколько байт stderr Real‑ESRGAN показать в логе при ошибке
+# запасной апскейл без Real‑ESRGAN: pil (по умолчанию) или vips (pyvips, быстрее на больших картинках);
+# RESIZE_FILTER=bicubic — заметно быстрее LANCZOS, годится для не-фото (UI, схемы, текст)
+_RESIZE_BACKEND = os.getenv("RESIZE_BACKEND", "pil").lower()
+_RESIZE_FILTER = (
+    Image.Resampling.BICUBIC
+    if os.getenv("RESIZE_FILTER", "lanczos").lower() == "bicubic"
+    else Image.Resampling.LANCZOS
+)
+
 
 def image_to_base64(path: Path) -> str:
-    ext = path.suffix.lower().lstrip(".")
-    if ext == "jpg":
-        ext = "jpeg"
-    mime = f"image/{ext}"
-    encoded = base64.b64encode(path.read_bytes()).decode("utf-8")
-    return f"data:{mime};base64,{encoded}"
+    # одна и та же картинка уходит в модель каждый ход — кодируем её один раз,
+    # пока файл не изменился (ключ — путь, mtime и размер)
+    st = path.stat()
+    return _encode_data_url(str(path), st.st_mtime_ns, st.st_size)
+
+
+def _downscaled(path: str) -> tuple[str, BytesIO] | None:
+    """(mime, байты) уменьшенной копии, если картинка больше _MAX_SEND_SIDE, иначе None."""
+    try:
+        img = Image.open(path)
+    except OSError:                 # не растр (svg и т.п.) — отдадим как есть
+        return None
+    with img:
+        if max(img.size) <= _MAX_SEND_SIDE:
+            return None
+        box = (_MAX_SEND_SIDE, _MAX_SEND_SIDE)
+        img.draft("RGB", box)       # JPEG: DCT-scaling при декодировании, прочим — no-op
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        buf = BytesIO()
+        if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+            img.save(buf, "PNG")
+            return "image/png", buf
+        img.convert("RGB").save(buf, "JPEG", quality=90)
+        return "image/jpeg", buf
+
+
+@functools.lru_cache(maxsize=32)
+def _encode_data_url(path: str, mtime_ns: int, size: int) -> str:
+    small = _downscaled(path)
+    if small is not None:
+        mime, buf = small
+        sink = bytearray(b"data:%s;base64," % mime.encode("ascii"))
+        sink += b2a_base64(buf.getbuffer(), newline=False)
+        return sink.decode("ascii")
+    mime = mimetypes.guess_type(path)[0] or "image/jpeg"
+    # data URL собираем сразу в одном bytearray и декодируем один раз:
+    # ни файла целиком в памяти, ни промежуточных str/f-string копий base64
+    sink = bytearray(b"data:%s;base64," % mime.encode("ascii"))
+    with open(path, "rb") as f:          # BufferedReader: read(n) отдаёт ровно n до EOF
+        while block := f.read(_B64_BLOCK):
+            sink += b2a_base64(block, newline=False)
+    return sink.decode("ascii")
 
 # ────────────────────────────────────────────────────────────
 # 🔼 UPSCALE
@@ -66,34 +124,80 @@ def apply_upscale(
         model,
     ]
 
-    try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        log.info("Upscaled %s → %s via Real‑ESRGAN", src, dst)
-    except FileNotFoundError:
-        log.warning("Real‑ESRGAN CLI not found — using PIL fallback")
-        _pil_upscale(src, dst, scale)
-    except subprocess.CalledProcessError as err:
-        log.error("Real‑ESRGAN failed (%s) — using PIL fallback", err)
-        _pil_upscale(src, dst, scale)
+    # stdout (прогресс) не нужен вовсе; stderr — во временный файл, не в память:
+    # читаем только его хвост и только при ошибке
+    with tempfile.TemporaryFile() as err_log:
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=err_log)
+            log.info("Upscaled %s → %s via Real‑ESRGAN", src, dst)
+        except FileNotFoundError:
+            log.warning("Real‑ESRGAN CLI not found — using %s fallback", _RESIZE_BACKEND)
+            dst = _fallback_upscale(src, dst, scale)
+        except subprocess.CalledProcessError as err:
+            log.error("Real‑ESRGAN failed (%s): %s — using %s fallback",
+                      err, _tail(err_log), _RESIZE_BACKEND)
+            dst = _fallback_upscale(src, dst, scale)
 
     return str(dst)
 
 
-def _pil_upscale(src: Path, dst: Path, scale: int):
+def _tail(f, size: int = _ERR_TAIL) -> str:
+    """Последние *size* байт файла-лога (курсор уже в конце) как текст."""
+    f.seek(max(0, f.tell() - size))
+    return f.read().decode("utf-8", "replace").strip()
+
+
+def _fallback_upscale(src: Path, dst: Path, scale: int) -> Path:
+    """Апскейл без Real‑ESRGAN; возвращает фактический путь результата."""
+    if _RESIZE_BACKEND == "vips":
+        try:
+            return _vips_upscale(src, dst, scale)
+        except ImportError:
+            log.warning("pyvips not installed — using PIL fallback")
+    return _pil_upscale(src, dst, scale)
+
+
+def _vips_upscale(src: Path, dst: Path, scale: int) -> Path:
+    import pyvips  # type: ignore  # необязательная зависимость, нужна только для RESIZE_BACKEND=vips
+
+    dst = dst.with_stem(f"{dst.stem}_vips")
+    # libvips обрабатывает картинку полосами и параллельно — без полного буфера в памяти
+    pyvips.Image.new_from_file(str(src)).resize(scale, kernel="lanczos3").write_to_file(str(dst))
+    log.info("Upscaled %s → %s via libvips", src, dst)
+    return dst
+
+
+def _pil_upscale(src: Path, dst: Path, scale: int) -> Path:
     dst = dst.with_stem(f"{dst.stem}_pil")
-    img = Image.open(src)
-    new_size = (img.width * scale, img.height * scale)
-    img = img.resize(new_size, Image.LANCZOS)
-    img.save(dst)
+    with Image.open(src) as img:
+        new_size = (img.width * scale, img.height * scale)
+        img.resize(new_size, _RESIZE_FILTER).save(dst)
     log.info("Upscaled %s → %s via PIL", src, dst)
+    return dst
 
 
 # ────────────────────────────────────────────────────────────
 # 🧼 BACKGROUND REMOVAL
 # -----------------------------------------------------------------------------
 
+@functools.cache
+def _rembg():
+    """(remove, session): rembg и ONNX-сессия грузятся при первом удалении фона — один раз на процесс."""
+    from rembg import new_session, remove  # type: ignore  # тяжёлый импорт (onnxruntime), не на старте
+
+    log.info("Loading rembg model %s", _REMBG_MODEL)
+    return remove, new_session(_REMBG_MODEL)
+
+
+def _rembg_hasher():
+    return hashlib.blake2b(digest_size=8, key=_REMBG_MODEL.encode()[:64])
+
+
 def remove_background(image_path: str | Path, *, out_dir: str | Path | None = None) -> str:
-    """Remove background and return path to PNG with alpha channel."""
+    """Remove background and return path to PNG with alpha channel.
+
+    Result is cached by content: same bytes + same model → existing PNG, rembg is not run.
+    """
 
     src = Path(image_path)
     if not src.exists():
@@ -101,14 +205,25 @@ def remove_background(image_path: str | Path, *, out_dir: str | Path | None = No
 
     out_dir = Path(out_dir or src.parent)
     out_dir.mkdir(parents=True, exist_ok=True)
-    dst = out_dir / f"{src.stem}_nobg.png"
 
+    # хэш считаем потоково (file_digest читает в свой буфер) — весь файл в bytes не поднимаем;
+    # ключ blake2b — имя модели: другая модель даёт другой хэш и, значит, другой файл
     with open(src, "rb") as f:
-        result = remove(f.read())
-
-    with open(dst, "wb") as f:
-        f.write(result)
+        key = hashlib.file_digest(f, _rembg_hasher).hexdigest()
+    dst = out_dir / f"{src.stem}_{key}_nobg.png"
+    if dst.exists():
+        log.info("Background already removed %s → %s (cached)", src, dst)
+        return str(dst)
+
+    remove, session = _rembg()
+    # PIL декодирует прямо из файла, rembg получает готовый Image — без копии исходника в bytes
+    with Image.open(src) as img:
+        result = remove(img, session=session)
+
+    # temp + replace: оборванная запись не оставит битый файл, который потом сочтётся кэшем
+    tmp = dst.with_suffix(".part")
+    result.save(tmp, "PNG")
+    os.replace(tmp, dst)
 
     log.info("Removed background %s → %s", src, dst)
     return str(dst)
-
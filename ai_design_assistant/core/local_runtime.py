@@ -0,0 +1,177 @@
+"""
+Общая часть локальных HF-бекендов (Pangea, Qwen2.5-VL).
+
+* устройство/dtype, ядро внимания, TF32, опциональный torch.compile;
+* необязательные ускорители: pybase64, turbojpeg;
+* скомпилированный chat-template, generate под inference_mode;
+* H2D-копия batch'а через pinned-буферы на отдельном CUDA-stream;
+* базовый класс бекенда с выгрузкой модели по простою.
+
+В отличие от core.models модуль тянет torch/transformers — его импортируют
+только api/local_*_backend.py.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import torch
+
+try:                                    # pybase64: SIMD base64 (AVX2/SSE4.1), API как у base64
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:                                    # libjpeg-turbo: SIMD-декодер + DCT-scaling прямо в RGB
+    from turbojpeg import TJPF_RGB, TurboJPEG
+    TJ = TurboJPEG()
+except (ImportError, OSError, RuntimeError):   # нет пакета или libturbojpeg в системе
+    TJPF_RGB = None
+    TJ = None
+
+try:                                    # тот же компилятор Jinja, что внутри transformers
+    from transformers.utils.chat_template_utils import _compile_jinja_template
+except ImportError:                     # старые transformers — останемся на apply_chat_template
+    _compile_jinja_template = None
+
+from ai_design_assistant.core.models import IdleUnloader, ModelBackend
+from ai_design_assistant.core.settings import Settings
+
+__all__ = [
+    "ATTN_IMPL",
+    "DEVICE",
+    "DTYPE",
+    "TJ",
+    "TJPF_RGB",
+    "TORCH_COMPILE",
+    "LocalHFBackend",
+    "base64",
+    "compile_decode",
+    "generate_no_grad",
+    "prepare_processor",
+    "to_device",
+]
+
+# ──────────────────────────────────────────────────────────────────
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+DTYPE  = torch.float16 if DEVICE == "cuda" else torch.float32
+
+try:                                    # FlashAttention-2 — только CUDA + fp16/bf16
+    import flash_attn  # noqa: F401
+    ATTN_IMPL = "flash_attention_2" if DEVICE == "cuda" else "sdpa"
+except ImportError:
+    ATTN_IMPL = "sdpa"
+# CUDA graphs через torch.compile — опционально: первая компиляция занимает десятки секунд
+TORCH_COMPILE = DEVICE == "cuda" and os.getenv("LOCAL_TORCH_COMPILE", "0") == "1"
+# TF32-тензорные ядра для оставшихся fp32-matmul (точность для инференса не страдает)
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.set_float32_matmul_precision("high")
+# ──────────────────────────────────────────────────────────────────
+
+
+def prepare_processor(proc, patch_size: int = 14) -> None:
+    """Гарантируем, что у процессора выставлен patch_size (некоторые версии HF опускают поле)."""
+    if getattr(proc, "patch_size", None) is None:
+        proc.patch_size = patch_size
+    if getattr(proc.image_processor, "patch_size", None) is None:
+        proc.image_processor.patch_size = patch_size
+
+
+def _precompile_template(template: str | None, tokenizer):
+    """Скомпилированный chat-template + спец-токены: render() мимо apply_chat_template
+    (без нормализации диалога и пересборки special_tokens_map на каждый вызов)."""
+    if _compile_jinja_template is None or not template:
+        return None, {}
+    return _compile_jinja_template(template), dict(tokenizer.special_tokens_map)
+
+
+def generate_no_grad(model, **kwargs):
+    """model.generate под inference_mode: строже no_grad — без version counters и view tracking."""
+    with torch.inference_mode():
+        return model.generate(**kwargs)
+
+
+def compile_decode(model, tokenizer) -> None:
+    """CUDA graphs для шага декодирования: статический KV-кэш + torch.compile(reduce-overhead)."""
+    model.generation_config.cache_implementation = "static"
+    model.forward = torch.compile(model.forward, mode="reduce-overhead", dynamic=False)
+    # прогрев: первая трассировка/захват графа — здесь, а не на первом ответе пользователю
+    ids = torch.tensor([[tokenizer.eos_token_id]], device=model.device)
+    generate_no_grad(model, input_ids=ids, max_new_tokens=2, pad_token_id=tokenizer.eos_token_id)
+
+
+# H2D: processor-тензоры → переиспользуемые pinned-буферы → асинхронная копия на отдельном stream.
+# Stream и буферы создаются при первой копии: импорт модуля не должен поднимать CUDA-контекст.
+_COPY_STREAM: torch.cuda.Stream | None = None
+_PINNED: dict[str, torch.Tensor] = {}
+_PINNED_LOCK = threading.Lock()
+_PIN_MAX_BYTES = 1 << 30        # крупнее — копируем как есть: pinned-память вытесняет RAM у ОС
+
+
+def to_device(batch, device) -> dict[str, torch.Tensor]:
+    global _COPY_STREAM
+    device = torch.device(device)
+    if device.type != "cuda":
+        return {k: v.to(device) for k, v in batch.items()}
+    current = torch.cuda.current_stream(device)
+    with _PINNED_LOCK:
+        if _COPY_STREAM is None:
+            _COPY_STREAM = torch.cuda.Stream(device)
+        stream = _COPY_STREAM
+        stream.synchronize()                    # прошлые копии из буферов завершены
+        out = {}
+        with torch.cuda.stream(stream):
+            for k, v in batch.items():
+                if v.numel() * v.element_size() > _PIN_MAX_BYTES:
+                    out[k] = v.to(device)
+                    continue
+                buf = _PINNED.get(k)
+                if buf is None or buf.dtype != v.dtype or buf.numel() < v.numel():
+                    buf = _PINNED[k] = torch.empty(v.numel(), dtype=v.dtype, pin_memory=True)
+                staged = buf[:v.numel()].view(v.shape).copy_(v)
+                out[k] = staged.to(device, non_blocking=True)
+                out[k].record_stream(current)   # тензор живёт на основном stream
+    current.wait_stream(stream)                 # generate стартует только после копии
+    return out
+
+
+class LocalHFBackend(ModelBackend, ABC):
+    """Общее для локальных бекендов: поля модели, chat-template, выгрузка по простою.
+
+    Подкласс грузит модель в ``_maybe_reload_model()`` (под ``_model_lock``),
+    вызывает ``_init_template()`` после загрузки токенизатора и реализует
+    ``unload_model()``.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # ничего тяжёлого (и даже чтения настроек): бекенд создаётся при импорте
+        self.model = None
+        self.processor = None
+        self.tokenizer = None
+        self._template_owner = None     # tokenizer или processor — чей chat_template рендерим
+        self._chat_tmpl = None          # скомпилированный chat-template (см. _init_template)
+        self._template_vars: dict = {}
+        # выгружаем не после каждого ответа, а после local_idle_unload_sec простоя
+        self._model_lock = threading.Lock()
+        self._idle = IdleUnloader(
+            self.unload_model, lambda: Settings.load().local_idle_unload_sec, lock=self._model_lock
+        )
+
+    def _init_template(self, owner) -> None:
+        self._template_owner = owner
+        self._chat_tmpl, self._template_vars = _precompile_template(owner.chat_template, self.tokenizer)
+
+    def _apply_template(self, msgs, tokenize: bool = False, add_generation_prompt: bool = False) -> str:
+        if self._chat_tmpl is None:
+            return self._template_owner.apply_chat_template(
+                msgs, tokenize=False, add_generation_prompt=add_generation_prompt
+            )
+        return self._chat_tmpl.render(
+            messages=msgs, add_generation_prompt=add_generation_prompt, **self._template_vars
+        )
+
+    @abstractmethod
+    def unload_model(self) -> None:
+        """Освободить VRAM; вызывается из таймера IdleUnloader под ``_model_lock``."""
@@ -13,10 +13,13 @@ in every record (``sk-…`` ➜ ``***``).
 """
 from __future__ import annotations
 
+import atexit
+import copy
 import logging
 import os
+import queue
 import re
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Final
 
@@ -39,29 +42,57 @@ _SECRET_ENV_VARS: Final = (
 _LOG_PATH = Path.home() / ".local" / "share" / "AI Design Assistant" / "ada.log"
 _LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-_SECRET_PATTERN = re.compile(r"(sk-[A-Za-z0-9]{20,})")
+# Generic pattern (sk-<token>)
+_SECRET_PATTERN: Final = r"sk-[A-Za-z0-9]{20,}"
+# (значения ключей из env, скомпилированная маска) — пересобираем, только если ключи поменялись
+_mask_cache: tuple[tuple[str, ...], re.Pattern[str]] | None = None
+
+
+def _mask_pattern() -> re.Pattern[str]:
+    """One regex alternation: current secret env values + generic ``sk-…`` pattern."""
+    global _mask_cache
+    values = tuple(v for var in _SECRET_ENV_VARS if (v := os.getenv(var)))
+    if _mask_cache is None or _mask_cache[0] != values:
+        # длинные значения первыми — при пересечении маскируется самое полное совпадение
+        alts = [re.escape(v) for v in sorted(values, key=len, reverse=True)]
+        _mask_cache = (values, re.compile("|".join([*alts, _SECRET_PATTERN])))
+    return _mask_cache[1]
 
 
 def _mask_secrets(msg: str) -> str:
     """Replace API keys in *msg* with asterisks before they hit log sinks."""
-    masked = msg
-    for var in _SECRET_ENV_VARS:
-        if (value := os.getenv(var)):
-            masked = masked.replace(value, "***")
-    # Generic pattern (sk-<token>)
-    masked = _SECRET_PATTERN.sub("***", masked)
-    return masked
+    # один проход по строке вместо str.replace на каждую переменную + отдельного sub
+    return _mask_pattern().sub("***", msg)
 
 
-class _SecretFilter(logging.Filter):
-    """`logging.Filter` that masks secrets inside LogRecord messages."""
+class _MaskingFormatter(logging.Formatter):
+    """`logging.Formatter` that masks secrets in the final rendered line.
+
+    Runs only for records a handler has already accepted, and leaves
+    ``record.msg``/``record.args`` untouched (lazy ``%`` formatting is kept).
+    """
 
-    def filter(self, record: logging.LogRecord) -> bool:  # noqa: ANN001
-        record.msg = _mask_secrets(str(record.msg))  # type: ignore[attr-defined]
-        if record.args:
-            # If using old‑style formatting — mask inside args too
-            record.args = tuple(_mask_secrets(str(a)) for a in record.args)
-        return True
+    def format(self, record: logging.LogRecord) -> str:
+        return _mask_secrets(super().format(record))
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """`QueueHandler`, который не форматирует запись в вызывающем потоке.
+
+    Штатный ``prepare()`` вызывает ``self.format(record)`` — %-подстановку
+    и трейсбек платил бы поток GUI/стрима. Здесь запись уходит в очередь как
+    есть, а форматирует её (с маскировкой) поток QueueListener. Заранее
+    рендерится только трейсбек, если он есть: ``exc_info`` держит живыми
+    кадры стека вызывающего.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record = copy.copy(record)  # другие обработчики видят исходную запись
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
 def _get_log_path(custom_path: str | Path | None = None) -> Path:
@@ -72,34 +103,43 @@ def _get_log_path(custom_path: str | Path | None = None) -> Path:
     return cfg_dir / _LOG_FILE_NAME
 
 
-_FMT = "% (asctime)s | %(levelname)-8s | %(name)s: %(message)s"
+_FMT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 _DATEFMT = "%Y-%m-%d %H:%M:%S"
 
+_listener: QueueListener | None = None  # фоновый поток записи логов, см. configure_logging()
+
 
 def configure_logging(level: str | int = "INFO") -> None:
     """
     Единая настройка логирования для CLI и GUI.
 
     • Формат без «лишних» скобок, чтобы бага Python-3.12 не срабатывала.
-    • Пишем и в консоль, и в файл с ротацией.
+    • Пишем и в консоль, и в файл с ротацией — из фонового потока (QueueListener).
     """
-    fmt = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    datefmt = "%Y-%m-%d %H:%M:%S"
-
+    global _listener
     root = logging.getLogger()
     root.setLevel(level if isinstance(level, int) else getattr(logging, level.upper()))
+    if _listener is not None:           # повторный вызов: меняем только уровень
+        return
 
     # stdout
     console = logging.StreamHandler()
-    console.setFormatter(logging.Formatter(fmt=fmt, datefmt=datefmt))
-    root.addHandler(console)
+    console.setFormatter(_MaskingFormatter(fmt=_FMT, datefmt=_DATEFMT))
 
     # файл с ротацией 1 МБ × 3
     file_handler = logging.handlers.RotatingFileHandler(
         _LOG_PATH, maxBytes=1_048_576, backupCount=3, encoding="utf-8"
     )
-    file_handler.setFormatter(logging.Formatter(fmt=fmt, datefmt=datefmt))
-    root.addHandler(file_handler)
+    file_handler.setFormatter(_MaskingFormatter(fmt=_FMT, datefmt=_DATEFMT))
+
+    # вызывающий поток (GUI, стрим LLM) только кладёт запись в очередь;
+    # запись в консоль/файл и ротация — в фоновом потоке QueueListener
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)     # stop() дописывает остаток очереди перед выходом
+
 
 # ------------------------------------------------------------------
 #  Старый API: некоторые плагины делают «from logger import get_logger»
@@ -7,8 +7,15 @@
 """
 from __future__ import annotations
 
+import contextlib
+import functools
 import logging
-from typing import Dict, List, Protocol, runtime_checkable
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Protocol, runtime_checkable
+
+from ai_design_assistant.core.settings import Settings
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,9 +40,44 @@ def register_backend(backend: ModelBackend) -> None:
         _LOGGER.debug("Backend %s already зарегистрирован — пропускаю", backend.name)
         return
     _BACKENDS[backend.name] = backend
+    list_models.cache_clear()
     _LOGGER.info("Backend %s зарегистрирован", backend.name)
 
 
+@functools.lru_cache(maxsize=1)
+def list_models() -> tuple[str, ...]:
+    """Имена доступных бекендов (кешируется до invalidate_models_cache())."""
+    load_builtin_backends()
+    return tuple(_BACKENDS)
+
+
+@functools.lru_cache(maxsize=1)
+def get_current_model() -> str:
+    """Выбранный в настройках провайдер, без чтения JSON на каждый вызов."""
+    return Settings.load().model_provider
+
+
+def set_current_model(name: str) -> None:
+    settings = Settings.load()
+    settings.model_provider = name
+    settings.save()
+    invalidate_models_cache()
+    warm_up(name)
+
+
+def warm_up(name: str | None) -> None:
+    """Прогреть бекенд заранее (соединение, …), если он это умеет; не блокирует."""
+    warmup = getattr(_BACKENDS.get(name), "warmup", None)
+    if callable(warmup):
+        warmup()
+
+
+def invalidate_models_cache() -> None:
+    """Сбросить кеш list_models()/get_current_model() (после смены настроек)."""
+    list_models.cache_clear()
+    get_current_model.cache_clear()
+
+
 # ai_design_assistant/core/models.py  ─────────────────────────────────
 def _to_dict(m):                                  # new helper
     return {"role": m.role, "content": m.content} if hasattr(m, "role") else m
@@ -45,21 +87,118 @@ def normalize(messages: list) -> list[dict[str, str]]:   # noqa: D401
     return [_to_dict(m) for m in messages]
 
 
+def coalesce(streamer, window_ms: int = 20) -> Iterator[str]:
+    """Склеить токены ``TextIteratorStreamer``, пришедшие в пределах *window_ms*.
+
+    UI всё равно перерисовывается не чаще раза в кадр, а так на каждый
+    yield приходится 5–10 токенов вместо одного.
+    """
+    q, stop = streamer.text_queue, streamer.stop_signal
+    window = window_ms / 1000
+    while True:
+        first = q.get(timeout=streamer.timeout)
+        if first is stop:
+            return
+        parts = [first]
+        deadline = time.monotonic() + window
+        while (left := deadline - time.monotonic()) > 0:
+            try:
+                token = q.get(timeout=left)
+            except queue.Empty:
+                break
+            if token is stop:
+                yield "".join(parts)
+                return
+            parts.append(token)
+        yield "".join(parts)
+
+
+class IdleUnloader:
+    """Вызывает *unload* после простоя, а не после каждого запроса.
+
+    Пока идёт хотя бы один запрос (``busy()``), таймер не взведён;
+    новый запрос отменяет отложенную выгрузку.
+
+    *lock* — lock модели у бекенда: выгрузка идёт под ним, а простой
+    перепроверяется уже после его захвата. Запрос, успевший войти в
+    ``busy()``, либо отменит выгрузку, либо дождётся её и загрузит модель заново.
+    """
+
+    def __init__(
+        self,
+        unload: Callable[[], None],
+        idle_seconds: Callable[[], float],
+        lock: threading.Lock | None = None,
+    ) -> None:
+        self._unload = unload
+        self._idle_seconds = idle_seconds
+        self._guard = lock if lock is not None else contextlib.nullcontext()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._timer: threading.Timer | None = None
+
+    @contextlib.contextmanager
+    def busy(self):
+        with self._lock:
+            self._active += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                if not self._active:
+                    self._timer = threading.Timer(max(self._idle_seconds(), 0), self._fire)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def _fire(self) -> None:
+        with self._guard:
+            with self._lock:
+                # таймер могли отменить/заменить, пока он ждал lock'и
+                if self._active or self._timer is not threading.current_thread():
+                    return
+                self._timer = None
+            self._unload()
+
+
 # ────────────────────────────────────────────────────────────────────
 #  Пытаемся подхватить встроенные/необязательные бекенды
 # ────────────────────────────────────────────────────────────────────
-for _module in (
+_BUILTIN_BACKENDS = (
     "ai_design_assistant.api.openai_backend",
     "ai_design_assistant.api.deepseek_backend",
     "ai_design_assistant.api.local_backend",
-    "ai_design_assistant.api.local_qwen25_backend"
-):
-    try:
-        mod = __import__(_module, fromlist=["backend"])
-        if getattr(mod, "backend", None):          # backend реально есть?
-            register_backend(mod.backend)
-    except Exception as exc:                       # ← один общий трай
-        _LOGGER.warning("Backend %s not registered: %s", _module, exc)
+    "ai_design_assistant.api.local_qwen25_backend",
+    "ai_design_assistant.api.local_vllm_backend",
+)
+_BUILTIN_LOCK = threading.Lock()
+_BUILTIN_LOADED = False
+
+
+def load_builtin_backends() -> None:
+    """Импортировать встроенные бекенды (один раз, потокобезопасно).
+
+    Вызывается лениво роутером или заранее из фонового потока в ``__main__``,
+    чтобы тяжёлые SDK не задерживали появление окна.
+    """
+    global _BUILTIN_LOADED
+    if _BUILTIN_LOADED:
+        return
+    with _BUILTIN_LOCK:
+        if _BUILTIN_LOADED:
+            return
+        for _module in _BUILTIN_BACKENDS:
+            try:
+                mod = __import__(_module, fromlist=["backend"])
+                if getattr(mod, "backend", None):          # backend реально есть?
+                    register_backend(mod.backend)
+            except Exception as exc:                       # ← один общий трай
+                _LOGGER.warning("Backend %s not registered: %s", _module, exc)
+        _BUILTIN_LOADED = True
+    warm_up(get_current_model())
 
 
 
@@ -70,14 +209,19 @@ class LLMRouter:
     """Простой диспетчер запросов к LLM-бекендам."""
 
     def __init__(self, default: str | None = None) -> None:
+        if default is None:
+            load_builtin_backends()
         self._default = default or (next(iter(_BACKENDS)) if _BACKENDS else None)
+        warm_up(self._default)          # смена провайдера в UI создаёт новый роутер
 
     @property
     def backends(self) -> list[str]:
+        load_builtin_backends()
         return list(_BACKENDS)
 
     # основной режим – получить весь ответ целиком
     def chat(self, messages: list[dict[str, str]], backend: str | None = None, **kw) -> str:
+        load_builtin_backends()
         if not _BACKENDS:
             raise RuntimeError("Нет доступных LLM-бекендов")
         name = backend or self._default
@@ -90,6 +234,7 @@ class LLMRouter:
 
     # потоковая версия; если бекенд не умеет стриминг – возвращаем всё сразу
     def stream(self, messages: list[dict[str, str]], backend: str | None = None, **kw):
+        load_builtin_backends()
         if not _BACKENDS:
             raise RuntimeError("Нет доступных LLM-бекендов")
         name = backend or self._default
@@ -76,6 +76,7 @@ class PluginManager:
 
     def __init__(self) -> None:
         self._plugins: MutableMapping[str, BasePlugin] = {}
+        self._tools: list[dict] | None = None   # кэш function_descriptions(), сбрасывает register()
         self._load_entrypoints()
         self._load_builtin()
 
@@ -90,7 +91,7 @@ class PluginManager:
                 if not issubclass(plugin_cls, BasePlugin):  # type: ignore[arg-type]
                     raise TypeError("Plugin class must inherit BasePlugin")
                 instance: BasePlugin = plugin_cls()
-                self._plugins[name] = instance
+                self.register(name, instance)
                 _LOGGER.info("Plugin '%s' loaded (%s)", name, plugin_cls)
             except Exception as exc:  # pragma: no cover
                 _LOGGER.warning("Failed to load plugin '%s': %s", name, exc)
@@ -130,7 +131,7 @@ class PluginManager:
             )
             if cls:
                 try:
-                    self._plugins[mod_name] = cls()
+                    self.register(mod_name, cls())
                 except Exception as exc:
                     _LOGGER.warning("Cannot init %s: %s", cls, exc)
                 continue
@@ -147,7 +148,7 @@ class PluginManager:
                     def run(self, **kwargs):              # noqa: D401
                         return module.process(**kwargs)
 
-                self._plugins[mod_name] = _Adapter()
+                self.register(mod_name, _Adapter())
 
 
     # ------------------------------------------------------------------
@@ -160,6 +161,38 @@ class PluginManager:
     def get(self, name: str) -> BasePlugin:
         return self._plugins[name]
 
+    def register(self, name: str, plugin: BasePlugin) -> None:
+        """Добавить (или заменить) плагин; описание tools пересоберётся при следующем запросе."""
+        self._plugins[name] = plugin
+        self._tools = None
+
+    def reload(self) -> None:
+        """Заново найти плагины (entry-point'ы и встроенные)."""
+        self._plugins.clear()
+        self._tools = None
+        self._load_entrypoints()
+        self._load_builtin()
+
+    def function_descriptions(self) -> list[dict]:
+        """Описания tools для LLM по плагинам с ``name`` и ``parameters``.
+
+        Список кэшируется до следующего register()/reload(); вызывающие его не изменяют.
+        """
+        if self._tools is None:
+            self._tools = [
+                {
+                    "type": "function",
+                    "function": {
+                        "name": plugin.name,
+                        "description": plugin.description,
+                        "parameters": plugin.parameters
+                    }
+                }
+                for plugin in self._plugins.values()
+                if hasattr(plugin, "name") and hasattr(plugin, "parameters")
+            ]
+        return self._tools
+
     def metadata(self) -> Mapping[str, PluginMeta]:
         return {
             name: PluginMeta(
@@ -200,18 +233,7 @@ def get_plugin_by_name(name: str) -> BasePlugin | None:
 
 def get_function_descriptions() -> list[dict]:
     """Формирует описание функций (tools) на основе всех плагинов."""
-    tools = []
-    for plugin in get_all_plugins():
-        if hasattr(plugin, "name") and hasattr(plugin, "parameters"):
-            tools.append({
-                "type": "function",
-                "function": {
-                    "name": plugin.name,
-                    "description": plugin.description,
-                    "parameters": plugin.parameters
-                }
-            })
-    return tools
+    return get_plugin_manager().function_descriptions()
 
 def call_function_by_name(name: str, **kwargs) -> str:
     plugin = get_plugin_manager().get(name)
@@ -77,6 +77,11 @@ class Settings:
 
     # ========= LLM Options ========= #
     local_unload_mode: str = "cpu"           # cpu | full
+    local_idle_unload_sec: int = 120         # выгружать после стольких секунд простоя
+    local_quant_backend: str = "bnb-nf4"     # bnb-nf4 | bnb-int8 | awq | gptq-marlin | none (Qwen2.5-VL)
+    # local_vllm: читаются при запуске движка — смена вступает в силу после перезапуска приложения
+    vllm_model: str = "Qwen/Qwen2.5-VL-3B-Instruct-AWQ"   # любой Qwen2.5-VL чекпойнт
+    vllm_max_images: int = 4                 # limit_mm_per_prompt: в запрос идут последние N картинок
 
     # ========= Plugins ========= #
     plugins_enabled: dict[str, bool] = field(default_factory=dict)
@@ -7,10 +7,9 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtGui import QPixmap, QIcon
 from PyQt6.QtCore import QSize, Qt, pyqtSignal
-from rembg import remove
-from PIL import Image
 from datetime import datetime
 
+from ai_design_assistant.core.image_utils import remove_background
 from ai_design_assistant.core.plugins import BaseImagePlugin
 from ai_design_assistant.ui.main_window import get_main_window
 
@@ -31,12 +30,8 @@ class RemoveBGPlugin(BaseImagePlugin):
     display_name = "Удаление фона"
 
     def run(self, image_path: str, **kwargs):
-        src = Path(image_path)
-        dst = src.with_stem(f"{src.stem}_nobg").with_suffix(".png")
-        with Image.open(src) as img:
-            result = remove(img)
-            result.save(dst)
-        return str(dst)
+        # rembg импортируется и модель грузится лениво, при первом вызове (см. image_utils._rembg)
+        return remove_background(image_path)
 
     def get_widget(self) -> QWidget:
         from ai_design_assistant.ui.main_window import get_main_window
@@ -44,11 +44,26 @@ display_name = "Upscale…"
 # Helper: light‑weight upscale preview (PIL bicubic)
 # ---------------------------------------------------------------------------
 
+_PREVIEW_BOX = 420
+
+
 def _pil_preview(src: Path, scale: int) -> QPixmap:
-    # Лёгкий preview с PIL → QPixmap через in-memory PNG
-    img = Image.open(src)
-    img_up = ImageOps.scale(img, scale, resample=Image.BICUBIC)
-    img_up.thumbnail((420, 420), resample=Image.BICUBIC)
+    # Лёгкий preview с PIL → QPixmap через in-memory PNG.
+    # Сразу считаем итоговый размер (апскейл ×scale, вписанный в _PREVIEW_BOX) и делаем
+    # один resize, а не «увеличить весь кадр → ужать thumbnail'ом».
+    with Image.open(src) as img:
+        w, h = img.width * scale, img.height * scale
+        k = min(1.0, _PREVIEW_BOX / max(w, h))
+        size = (max(1, round(w * k)), max(1, round(h * k)))
+        if size[0] < img.width:
+            # превью меньше исходника: JPEG декодируется сразу уменьшенным (DCT-scaling),
+            # затем целый шаг reduce() (box-фильтр) — до BICUBIC доходит уже мало пикселей
+            img.draft("RGB", size)
+            factor = min(img.width // size[0], img.height // size[1])
+            src_img = img.reduce(factor) if factor >= 2 else img
+        else:
+            src_img = img
+        img_up = src_img.resize(size, resample=Image.BICUBIC)
 
     # конвертация PIL → байты PNG
     from io import BytesIO
@@ -137,7 +152,7 @@ def process(image_path: str, *, scale: int = 2, png: bool = False, **_) -> str:
         "-n", "realesrgan-x4plus",
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         log.info("Upscaled via Real‑ESRGAN → %s", out)
         return str(out)
     except (FileNotFoundError, subprocess.CalledProcessError):
@@ -500,12 +500,15 @@ class MainWindow(QMainWindow):
     def reload_settings(self) -> None:
         """Перезагрузить настройки и пересоздать router."""
         from importlib import import_module, reload
-        from ai_design_assistant.core.models import LLMRouter, register_backend, _BACKENDS
+        from ai_design_assistant.core.models import (
+            LLMRouter, register_backend, _BACKENDS, invalidate_models_cache,
+        )
 
         self.settings = Settings.load()
 
         # 🧹 убираем старые бекенды
         _BACKENDS.clear()
+        invalidate_models_cache()
 
         # ── загружаем (или перезагружаем) нужный модуль ──────────────────
         name = self.settings.model_provider
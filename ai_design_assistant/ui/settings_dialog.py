@@ -43,13 +43,21 @@ from PyQt6.QtWidgets import (
 from ai_design_assistant.core.settings import Settings
 
 _THEME_CHOICES: Final = ["auto", "light", "dark"]
-_PROVIDER_CHOICES: Final = ["openai", "deepseek", "local", "local_qwen25"]
+_PROVIDER_CHOICES: Final = ["openai", "deepseek", "local", "local_qwen25", "local_vllm"]
 _UNLOAD_CHOICES: Final = {
     "none": "Не выгружать (максимальная скорость)",
     "cpu": "Выгружать в RAM (экономия VRAM)",
     "full": "Полная выгрузка (экономия VRAM и RAM)",
 }
 
+_QUANT_CHOICES: Final = {
+    "bnb-nf4": "BitsAndBytes NF4 (на лету)",
+    "bnb-int8": "BitsAndBytes INT8 (на лету)",
+    "awq": "AWQ INT4 (готовый чекпойнт)",
+    "gptq-marlin": "GPTQ INT4 + Marlin (готовый чекпойнт)",
+    "none": "Без квантизации (FP16)",
+}
+
 
 
 
@@ -121,6 +129,13 @@ class SettingsDialog(QDialog):
         unload_cb.setCurrentIndex(index)
         g_form.addRow("Unload mode:", unload_cb)
 
+        # 4-bit backend for local Qwen2.5-VL
+        quant_cb = QComboBox()
+        for key, label in _QUANT_CHOICES.items():
+            quant_cb.addItem(label, userData=key)
+        quant_cb.setCurrentIndex(max(quant_cb.findData(self._settings.local_quant_backend), 0))
+        g_form.addRow("Quantization:", quant_cb)
+
 
         # === API-keys tab === #
         api_w = QWidget()
@@ -175,6 +190,7 @@ class SettingsDialog(QDialog):
         self._deepseek_le = deepseek_le
         self._plugin_cbs = checkboxes
         self._unload_cb = unload_cb
+        self._quant_cb = quant_cb
 
     # ------------------------------------------------------------------#
     #  Accept / save                                                    #
@@ -184,11 +200,12 @@ class SettingsDialog(QDialog):
         raw_path = Path(self._chats_le.text().strip())
 
         # Если пользователь по ошибке указал файл – берём родительскую папку
-        if raw_path.suffix.lower() == ".json" or raw_path.is_file():
+        if raw_path.suffix.lower() in (".json", ".jsonl") or raw_path.is_file():
             raw_path = raw_path.parent
 
         self._settings.chats_path = str(raw_path)
         self._settings.local_unload_mode = self._unload_cb.currentData()
+        self._settings.local_quant_backend = self._quant_cb.currentData()
         self._settings.chats_path = self._chats_le.text().strip()
         self._settings.model_provider = self._model_cb.currentText()
         self._settings.theme = self._theme_cb.currentText()
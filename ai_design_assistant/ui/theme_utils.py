@@ -6,6 +6,7 @@ case we approximate the scheme from window background luminance.
 """
 from __future__ import annotations
 
+from functools import lru_cache
 from pathlib import Path
 from typing import Literal
 
@@ -31,9 +32,13 @@ def load_stylesheet(theme: Literal["light", "dark", "auto", ""] = "auto") -> str
     if not theme or theme == "auto":
         theme = _detect_system_theme()
 
-    base_qss = (_THEMES / f"{theme}.qss").read_text(encoding="utf-8")
-    chat_qss = (_THEMES / "chat.qss").read_text(encoding="utf-8")
-    return base_qss + "\n" + chat_qss
+    return _read_qss(f"{theme}.qss") + "\n" + _read_qss("chat.qss")
+
+
+@lru_cache(maxsize=None)
+def _read_qss(name: str) -> str:
+    """Read a theme file once per process (theme toggles reuse the text)."""
+    return (_THEMES / name).read_text(encoding="utf-8")
 
 
 # ---------------------------------------------------------------------------
@@ -32,8 +32,10 @@ class GenerateThread(QThread):
             prepared_messages = []
             for msg in self.messages:
                 if getattr(msg, "image", None):
-                    image_path = self.chat_path / msg.image
-                    base64_data = image_to_base64(image_path)
+                    if msg.image.startswith("data:"):   # уже data-URL — отдаём как есть
+                        base64_data = msg.image
+                    else:
+                        base64_data = image_to_base64(self.chat_path / msg.image)
                     prepared_messages.append({
                         "role": msg.role,
                         "content": [
@@ -48,19 +50,19 @@ class GenerateThread(QThread):
                     })
 
             # 📡 Потоковая генерация с final_message в конце
-            full_text = ""
+            parts: list[str] = []   # join один раз в конце, а не += на каждый токен
             message = None
 
             for result in self.get_router().stream(prepared_messages, backend=self.get_router()._default):
                 if isinstance(result, str):
                     self.token_received.emit(result)
-                    full_text += result
+                    parts.append(result)
                 elif hasattr(result, "final_message"):
                     message = result.final_message  # ✅ тут tool_calls
 
             # ✅ Сохраняем сообщение от ассистента
             chat = ChatSession.load(self.chat_json_path)
-            msg = chat.add_message("assistant", full_text)
+            msg = chat.add_message("assistant", "".join(parts))
 
             # 🛠️ Обработка tool_calls (если есть)
             if message and "tool_calls" in message and message["tool_calls"]:
@@ -194,3 +194,224 @@ def test_base64_mime_type():
     header = encoded.split(",", 1)[0]
     assert "image" in header, "Base64 MIME header не содержит 'image'"
 
+
+import queue
+
+from ai_design_assistant.core.models import coalesce
+
+
+class _FakeStreamer:
+    """Минимум TextIteratorStreamer, который читает coalesce()."""
+
+    def __init__(self):
+        self.text_queue = queue.Queue()
+        self.stop_signal = object()
+        self.timeout = 1.0
+
+
+# Тест 21: coalesce склеивает токены, пришедшие в одном окне
+def test_coalesce_merges_tokens():
+    streamer = _FakeStreamer()
+    for token in ("a", "b", "c", streamer.stop_signal):
+        streamer.text_queue.put(token)
+    assert list(coalesce(streamer, window_ms=50)) == ["abc"]
+
+    streamer = _FakeStreamer()
+    streamer.text_queue.put(streamer.stop_signal)
+    assert list(coalesce(streamer)) == [], "Пустой стрим не должен ничего отдавать"
+
+
+import threading
+import time
+
+from ai_design_assistant.core.models import IdleUnloader
+
+
+# Тест 22: IdleUnloader выгружает после простоя, новый запрос отменяет выгрузку
+def test_idle_unloader_timing_and_cancel():
+    fired = threading.Event()
+    idle = IdleUnloader(fired.set, lambda: 0.2)
+
+    with idle.busy():
+        pass
+    with idle.busy():                   # запрос до срабатывания таймера
+        time.sleep(0.3)
+        assert not fired.is_set(), "Выгрузка во время запроса"
+    assert fired.wait(2), "Выгрузка после простоя не произошла"
+
+
+# Тест 23: _run_tools возвращает результаты в порядке вызовов
+def test_run_tools_keeps_order(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    openai_backend = pytest.importorskip("ai_design_assistant.api.openai_backend")
+
+    def slow_tool(name, args):
+        time.sleep(args["delay"])       # первые заканчиваются последними
+        return name
+
+    monkeypatch.setattr(openai_backend, "_run_tool", slow_tool)
+    calls = [(f"t{i}", {"delay": 0.05 * (3 - i)}) for i in range(4)]
+    assert openai_backend._run_tools(calls) == ["t0", "t1", "t2", "t3"]
+
+
+# Тест 24: image_to_base64 кэширует data URL, пока файл не изменился
+def test_image_to_base64_cache(tmp_path):
+    path = tmp_path / "pic.png"
+    Image.new("RGB", (16, 16), "red").save(path)
+
+    encoded = image_to_base64(path)
+    assert image_to_base64(path) is encoded, "Повторный вызов должен брать кэш"
+
+    Image.new("RGB", (8, 8), "blue").save(path)   # файл изменился — кэш не используется
+    assert image_to_base64(path) != encoded
+
+
+from io import BytesIO
+
+from ai_design_assistant.core import image_utils
+
+
+# Тест 25: крупная картинка уменьшается до _MAX_SEND_SIDE перед отправкой
+def test_image_to_base64_downscale(tmp_path):
+    side = image_utils._MAX_SEND_SIDE
+    path = tmp_path / "big.png"
+    Image.new("RGB", (side * 2, side // 2), "red").save(path)
+
+    encoded = image_to_base64(path)
+    decoded = Image.open(BytesIO(base64.b64decode(encoded.split(",", 1)[1])))
+    assert max(decoded.size) <= side, f"Картинка не уменьшена: {decoded.size}"
+
+
+import json
+
+from ai_design_assistant.core import chat as chat_mod
+
+
+@pytest.fixture
+def chats_dir(tmp_path, monkeypatch):
+    """Чаты — во временной папке, а не в data/chats пользователя."""
+    monkeypatch.setattr(chat_mod, "get_chats_directory", lambda: tmp_path)
+    return tmp_path
+
+
+# Тест 26: JSONL — заголовок первой строкой, дальше по строке на сообщение
+def test_chat_jsonl_roundtrip(chats_dir):
+    session = ChatSession.create_new()
+    session.add_message("user", "Привет!")
+    session.add_message("assistant", "Здравствуйте!")
+
+    lines = session._path.read_bytes().splitlines()
+    assert session._path.suffix == ".jsonl"
+    assert json.loads(lines[0])["uuid"] == session.uuid, "Первая строка — не заголовок"
+    assert [json.loads(line)["content"] for line in lines[1:]] == ["Привет!", "Здравствуйте!"]
+
+    loaded = ChatSession.load(session._path)
+    assert loaded.messages == session.messages, "Сообщения изменились после загрузки"
+
+
+# Тест 27: старый .json читается и при первой записи переписывается в .jsonl
+def test_chat_legacy_json_migration(chats_dir):
+    folder = chats_dir / "chat_1"
+    folder.mkdir()
+    legacy = folder / "chat_1.json"
+    legacy.write_text(json.dumps({
+        "title": "old",
+        "uuid": "u1",
+        "schema_version": 1,
+        "messages": [{"role": "user", "content": "x"}],
+    }), encoding="utf-8")
+
+    session = ChatSession.load_all()[0]
+    assert session.title == "old" and session.messages[0].content == "x"
+
+    session.add_message("assistant", "y")
+    assert not legacy.exists(), "Старый .json должен быть удалён после миграции"
+    migrated = ChatSession.load(folder / "chat_1.jsonl")
+    assert [m.content for m in migrated.messages] == ["x", "y"]
+
+
+# Тест 28: batched_saves пишет пачку одним заходом на выходе из блока
+def test_chat_batched_saves(chats_dir):
+    session = ChatSession.create_new()
+    session.add_message("user", "a")
+    with session.batched_saves():
+        session.add_message("assistant", "b")
+        session.add_message("assistant", "c")
+        assert len(session._path.read_bytes().splitlines()) == 2, "Запись не отложена"
+    assert [m.content for m in ChatSession.load(session._path).messages] == ["a", "b", "c"]
+
+
+from ai_design_assistant.core.chat import Message
+
+
+# Тест 29: from_trusted_dict — полная запись напрямую, неполная — через конструктор
+def test_message_from_trusted_dict():
+    original = Message(role="user", content="hi", image="images/a.png")
+    full = chat_mod._message_to_dict(original)
+    assert Message.from_trusted_dict(full) == original
+
+    partial = Message.from_trusted_dict({"role": "assistant", "content": "ok"})
+    assert partial.content == "ok" and partial.image is None and partial.uuid, "Не подставлены значения по умолчанию"
+
+
+from ai_design_assistant.core.logger import _mask_secrets
+
+
+# Тест 30: маскировка ключей из env и шаблона sk-…
+def test_mask_secrets(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "my-secret-value-123")
+    generic = "sk-" + "a" * 24
+    masked = _mask_secrets(f"key=my-secret-value-123 other={generic}")
+    assert masked == "key=*** other=***"
+
+
+import logging
+
+from ai_design_assistant.core.logger import _MaskingFormatter
+
+
+# Тест 31: форматтер маскирует итоговую строку, не трогая msg/args записи
+def test_masking_formatter(monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "ds-secret-456")
+    record = logging.LogRecord("t", logging.INFO, __file__, 1, "token %s", ("ds-secret-456",), None)
+    assert _MaskingFormatter("%(message)s").format(record) == "token ***"
+    assert record.args == ("ds-secret-456",), "Формат не должен менять запись"
+
+
+# Тест 32: выгрузка ждёт lock модели и перепроверяет простой под ним
+def test_idle_unloader_respects_model_lock():
+    fired = threading.Event()
+    model_lock = threading.Lock()
+    idle = IdleUnloader(fired.set, lambda: 0.05, lock=model_lock)
+
+    with model_lock:
+        with idle.busy():
+            pass
+        time.sleep(0.2)                 # таймер сработал и ждёт lock
+        assert not fired.is_set()
+        entered = idle.busy()
+        entered.__enter__()             # запрос успел начаться — выгрузка отменяется
+    time.sleep(0.1)
+    assert not fired.is_set(), "Выгрузка при активном запросе"
+    entered.__exit__(None, None, None)
+    assert fired.wait(2)
+
+
+# Тест 33: оборванная последняя строка отбрасывается, порча в середине — ошибка
+def test_chat_torn_last_line(chats_dir):
+    session = ChatSession.create_new()
+    session.add_message("user", "a")
+    session.add_message("assistant", "b")
+    with session._path.open("ab") as f:
+        f.write(b'{"role": "user", "cont')
+
+    loaded = ChatSession.load(session._path)
+    assert [m.content for m in loaded.messages] == ["a", "b"]
+    loaded.add_message("user", "c")
+    assert [m.content for m in ChatSession.load(session._path).messages] == ["a", "b", "c"]
+
+    lines = session._path.read_bytes().splitlines()
+    lines.insert(2, b"{broken")
+    session._path.write_bytes(b"\n".join(lines) + b"\n")
+    with pytest.raises(ValueError):
+        ChatSession.load(session._path)